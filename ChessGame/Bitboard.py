@@ -0,0 +1,136 @@
+"""
+Bitboard File:
+Responsibilities:
+1. Square numbering shared by the engine (square = row * 8 + col, so a8 = 0 and h1 = 63)
+2. Precomputed attack tables for knights, kings and pawns
+3. Sliding attacks for rooks, bishops and queens on a given occupancy
+"""
+
+FULL = (1 << 64) - 1
+
+# Directions as (row step, col step)
+NORTH, SOUTH, EAST, WEST = (-1, 0), (1, 0), (0, 1), (0, -1)
+NORTH_EAST, NORTH_WEST, SOUTH_EAST, SOUTH_WEST = (-1, 1), (-1, -1), (1, 1), (1, -1)
+
+ROOK_DIRECTIONS = (NORTH, SOUTH, EAST, WEST)
+BISHOP_DIRECTIONS = (NORTH_EAST, NORTH_WEST, SOUTH_EAST, SOUTH_WEST)
+ALL_DIRECTIONS = ROOK_DIRECTIONS + BISHOP_DIRECTIONS
+
+KNIGHT_STEPS = ((-2, 1), (-2, -1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
+
+
+def square(r, c):
+    return r * 8 + c
+
+
+def lsb(bb):
+    return (bb & -bb).bit_length() - 1
+
+
+def msb(bb):
+    return bb.bit_length() - 1
+
+
+def popCount(bb):
+    return bin(bb).count("1")
+
+
+# Iterate over the squares of a bitboard, lowest square first
+def squares(bb):
+    while bb:
+        bit = bb & -bb
+        bb ^= bit
+        yield bit.bit_length() - 1
+
+
+def _onBoard(r, c):
+    return 0 <= r < 8 and 0 <= c < 8
+
+
+def _stepTable(steps):
+    table = []
+    for sq in range(64):
+        r, c = divmod(sq, 8)
+        bb = 0
+        for dr, dc in steps:
+            if _onBoard(r + dr, c + dc):
+                bb |= 1 << square(r + dr, c + dc)
+        table.append(bb)
+    return table
+
+
+def _rayTable(direction):
+    dr, dc = direction
+    table = []
+    for sq in range(64):
+        r, c = divmod(sq, 8)
+        bb = 0
+        r, c = r + dr, c + dc
+        while _onBoard(r, c):
+            bb |= 1 << square(r, c)
+            r, c = r + dr, c + dc
+        table.append(bb)
+    return table
+
+
+KNIGHT_ATTACKS = _stepTable(KNIGHT_STEPS)
+KING_ATTACKS = _stepTable(ALL_DIRECTIONS)
+
+# Squares a pawn of the given colour attacks from each square (white moves towards row 0)
+PAWN_ATTACKS = {
+    'w': _stepTable((NORTH_EAST, NORTH_WEST)),
+    'b': _stepTable((SOUTH_EAST, SOUTH_WEST)),
+}
+
+RAYS = {direction: _rayTable(direction) for direction in ALL_DIRECTIONS}
+
+# A direction is "positive" when it walks towards higher square numbers,
+# so the nearest blocker on the ray is the lowest set bit, otherwise the highest
+_POSITIVE = {direction: direction[0] * 8 + direction[1] > 0 for direction in ALL_DIRECTIONS}
+
+
+def rayAttacks(sq, occupied, direction):
+    ray = RAYS[direction]
+    attacks = ray[sq]
+    blockers = attacks & occupied
+    if blockers:
+        blocker = lsb(blockers) if _POSITIVE[direction] else msb(blockers)
+        attacks ^= ray[blocker]
+    return attacks
+
+
+def rookAttacks(sq, occupied):
+    return (rayAttacks(sq, occupied, NORTH) | rayAttacks(sq, occupied, SOUTH)
+            | rayAttacks(sq, occupied, EAST) | rayAttacks(sq, occupied, WEST))
+
+
+def bishopAttacks(sq, occupied):
+    return (rayAttacks(sq, occupied, NORTH_EAST) | rayAttacks(sq, occupied, NORTH_WEST)
+            | rayAttacks(sq, occupied, SOUTH_EAST) | rayAttacks(sq, occupied, SOUTH_WEST))
+
+
+def queenAttacks(sq, occupied):
+    return rookAttacks(sq, occupied) | bishopAttacks(sq, occupied)
+
+
+# Slider attacks on an empty board, a cheap first test before walking the rays
+ROOK_RAYS = [rookAttacks(sq, 0) for sq in range(64)]
+BISHOP_RAYS = [bishopAttacks(sq, 0) for sq in range(64)]
+
+
+def _betweenTables():
+    between = [[0] * 64 for _ in range(64)]
+    line = [[0] * 64 for _ in range(64)]
+    for a in range(64):
+        for direction in ALL_DIRECTIONS:
+            opposite = (-direction[0], -direction[1])
+            ray = RAYS[direction][a]
+            for b in squares(ray):
+                between[a][b] = ray & ~RAYS[direction][b] & ~(1 << b)
+                line[a][b] = ray | RAYS[opposite][a] | (1 << a)
+    return between, line
+
+
+# BETWEEN[a][b]: squares strictly between two aligned squares
+# LINE[a][b]: the whole rank, file or diagonal through both of them (0 when not aligned)
+BETWEEN, LINE = _betweenTables()
@@ -1,8 +1,28 @@
+# Castling rights are one 4 bit mask, a bit per right, in the order of the Zobrist castling keys
+WKS = 1 # White king side
+WQS = 2 # White queen side
+BKS = 4 # Black king side
+BQS = 8 # Black queen side
+ALL_RIGHTS = WKS | WQS | BKS | BQS
 
-class CastleRights():
-    def __init__(self, wks, bks, wqs, bqs):
-        self.wks = wks
-        self.bks = bks
-        self.wqs = wqs
-        self.bqs = bqs
-      
\ No newline at end of file
+# Rights left after a move from or to each square (row * 8 + col): a king leaving its square drops both
+# rights of its side, a rook leaving its corner or being captured there drops the right of that rook
+CASTLING_KEEP = [ALL_RIGHTS] * 64
+CASTLING_KEEP[60] &= ~(WKS | WQS) # e1
+CASTLING_KEEP[56] &= ~WQS # a1
+CASTLING_KEEP[63] &= ~WKS # h1
+CASTLING_KEEP[4] &= ~(BKS | BQS) # e8
+CASTLING_KEEP[0] &= ~BQS # a8
+CASTLING_KEEP[7] &= ~BKS # h8
+
+FEN_RIGHTS = [("K", WKS), ("Q", WQS), ("k", BKS), ("q", BQS)]
+
+
+# Mask from the castling field of a FEN, e.g. "KQkq" or "-"
+def parseCastling(text):
+    return sum(bit for char, bit in FEN_RIGHTS if char in text)
+
+
+# Castling field of a FEN for a mask
+def castlingFen(rights):
+    return "".join(char for char, bit in FEN_RIGHTS if rights & bit) or "-"
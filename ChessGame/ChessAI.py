@@ -1,5 +1,22 @@
 
 import random
+import time
+import multiprocessing
+import os
+import queue
+import sys
+import cProfile
+import pstats
+import tracemalloc
+from ChessGame.ChessEngine import GameState
+from ChessGame.MoveOrdering import MoveOrderer
+from ChessGame.OpeningBook import OpeningBook
+from ChessGame.Tablebase import Tablebase, MAX_PIECES as TABLEBASE_PIECES
+from ChessGame.Bitboard import popCount
+from ChessGame.TranspositionTable import TranspositionTable, EXACT, LOWER, UPPER, DEFAULT_ENTRIES, \
+    MOVE_MASK, SCORE_SHIFT, SCORE_MASK, SCORE_OFFSET, DEPTH_SHIFT, BOUND_SHIFT
+from ChessGame.Evaluation import evaluate
+from ChessGame.Move import Move
 
 
 piecesScore = {
@@ -12,9 +29,17 @@ piecesScore = {
 }
 
 # HIGHLY IMPORTANT VARIABLES, DO NOT CHANGE
-CHECKMATE = 1000
+# Scores are in centipawns (see Evaluation), mate has to stay far above any material count
+CHECKMATE = 100000
 STALEMATE = 0
 DEPTH = 2
+MAX_DEPTH = 64 # Iterative deepening ceiling when searching on a time or node budget
+MAX_PLY = 128 # Deepest ply the main search plus quiescence may reach
+
+# Polyglot opening book looked at before searching, set with useOpeningBook
+openingBook = None
+# Endgame tablebase probed inside the search, set with useTablebase
+tablebase = None
 
 
 # Return a random moves of valid moves
@@ -55,7 +80,7 @@ def findBestMove(gamestate, validMoves):
                 elif gamestate.staleMate == True:
                     cur_score = STALEMATE
                 else:
-                    cur_score = -turnMultipler * scoreMaterial(gamestate.board)
+                    cur_score = -turnMultipler * evaluate(gamestate)
 
                 # Update opp max scorwee value
                 if (cur_score > oppMaxScore):
@@ -70,63 +95,469 @@ def findBestMove(gamestate, validMoves):
     return bestPlayerMove
 
 
-# Find best move in min max algo, helper method for the first move
-# Repeatly finding min and max at each decision with the depth of constant, 
-# check and find whatever the best move giving the value
+# Open a Polyglot .bin book for every later search, None closes the current one
+def useOpeningBook(path):
+    global openingBook
+    if openingBook is not None:
+        openingBook.close()
+    openingBook = OpeningBook(path) if path else None
 
-def findBestMoveMinMax(gamestate, validMoves):
-    global nextMove
-    nextMove = None
-    findMoveMinMax(gamestate, validMoves, DEPTH, gamestate.whiteToMove)
-    return nextMove
 
-def findMoveMinMax(gamestate, validMoves, depth, whiteToMove):
-    global nextMove
+# Probe the endgame tables in directory (see Tablebase) during every later search, None stops probing
+def useTablebase(directory):
+    global tablebase
+    tablebase = Tablebase(directory) if directory else None
+
 
-    # STOP the recursive aka base case
-    if depth == 0:
-        return scoreBoard(gamestate)
+# Move from the opening book for this position, None without a book or once out of book
+def bookMove(gamestate):
+    return openingBook.pickMove(gamestate) if openingBook is not None else None
 
-    # IF white to move
-    if whiteToMove:
 
-        max_score = -CHECKMATE
-        for move in validMoves:
+# Find best move with the negamax search, helper method for the UI
+# Plays from the opening book while it can, otherwise searches to the constant depth and only returns the move
+def findBestMoveMinMax(gamestate, validMoves):
+    move = bookMove(gamestate)
+    if move is not None:
+        return move
+    return findBestMoveNegamax(gamestate, validMoves).bestMove
+
+
+# Iterative deepening negamax search with alpha beta pruning
+# Deepens one ply at a time until maxDepth, or until the time (seconds) / node budget runs out
+# Without a budget it searches to DEPTH, with one it keeps going up to MAX_DEPTH
+# Pass the same ordering (MoveOrdering.MoveOrderer by default) to keep killers and history between moves
+# and a TranspositionTable to remember searched positions, there is none by default
+# stop (a threading / multiprocessing Event) ends the search early from another thread
+def findBestMoveNegamax(gamestate, validMoves, maxDepth = None, timeLimit = None, nodeLimit = None, ordering = None, table = None,
+                        stop = None):
+    if maxDepth is None:
+        maxDepth = DEPTH if timeLimit is None and nodeLimit is None else MAX_DEPTH
+    return Search(gamestate, maxDepth, timeLimit, nodeLimit, ordering, table, stop).run(validMoves)
+
+
+# Lazy SMP: the same search in several processes at once, sharing one transposition table
+# Every worker searches the whole tree, they only differ in the depth they start at and in the
+# order of equal root moves, so they fill the table with different lines and help each other through it
+# The main worker's budget decides when everyone stops, the deepest finished iteration is returned
+# On platforms that spawn processes the caller needs the usual if __name__ == "__main__" guard
+def findBestMoveParallel(gamestate, workers = None, maxDepth = None, timeLimit = None, nodeLimit = None,
+                         tableEntries = DEFAULT_ENTRIES):
+    start = time.perf_counter()
+    validMoves = gamestate.getValidateMoves()
+    if not validMoves:
+        return SearchResult(None, 0, 0, [], 0, 0, SearchStats())
+    move = bookMove(gamestate)
+    if move is not None:
+        return SearchResult(move, 0, 0, [move], 0, time.perf_counter() - start, SearchStats())
+    if maxDepth is None:
+        maxDepth = DEPTH if timeLimit is None and nodeLimit is None else MAX_DEPTH
+    workers = workers or os.cpu_count() or 1
+
+    table = TranspositionTable.createShared(tableEntries)
+    context = multiprocessing.get_context()
+    stop = context.Event()
+    results = context.Queue()
+    processes = [context.Process(target = parallelWorker, daemon = True,
+                                 args = (i, gamestate.toFen(), table.name, table.entries, maxDepth, timeLimit, nodeLimit, stop, results))
+                 for i in range(workers)]
+    try:
+        for process in processes:
+            process.start()
+        finished = []
+        while len(finished) < workers:
+            try:
+                message = results.get(timeout = 1)
+            except queue.Empty:
+                # Every worker posts even when it fails, one that is gone without posting was killed
+                crashed = [process.exitcode for process in processes if process.exitcode not in (None, 0)]
+                if crashed:
+                    raise RuntimeError("Parallel search worker died with exit code %d" % crashed[0])
+                continue
+            if message[6] is not None:
+                raise RuntimeError("Parallel search worker %d failed: %s" % (message[0], message[6]))
+            finished.append(message)
+            if message[0] == 0: # Main worker is done, call off the helpers
+                stop.set()
+        for process in processes:
+            process.join()
+    finally:
+        stop.set()
+        table.close()
+        table.unlink()
+
+    # Deepest iteration wins, the main worker breaks ties
+    worker, depth, score, pv, nodes, stats, error = max(finished, key = lambda result: (result[1], result[0] == 0))
+    # Counters add up over all workers, the iterations are the main worker's
+    merged = SearchStats()
+    for result in sorted(finished, key = lambda result: result[0]):
+        merged.merge(result[5])
+    merged.elapsed = time.perf_counter() - start
+    return SearchResult(Move.fromCode(pv[0]) if pv else validMoves[0], score, depth, [Move.fromCode(code) for code in pv],
+                        merged.nodes, merged.elapsed, merged)
+
+
+# Body of one Lazy SMP process, posts (worker, depth, score, pv codes, nodes, stats, error) to results
+# It always posts exactly once, error is None on success and the exception text otherwise
+def parallelWorker(worker, fen, tableName, tableEntries, maxDepth, timeLimit, nodeLimit, stop, results):
+    table = None
+    message = (worker, 0, 0, [], 0, None, "no result")
+    try:
+        table = TranspositionTable.attach(tableName, tableEntries)
+        gamestate = GameState.fromFen(fen)
+        moves = gamestate.generateMoves()
+        shift = worker % len(moves)
+        moves = moves[shift:] + moves[:shift] # Helpers try equal root moves in another order
+        search = Search(gamestate, maxDepth, timeLimit, nodeLimit, table = table, stop = stop if worker else None,
+                        startDepth = 1 + worker % 2)
+        result = search.run(moves)
+        message = (worker, result.depth, result.score, [move.code for move in result.pv], result.nodes, result.stats, None)
+    except Exception as error:
+        message = (worker, 0, 0, [], 0, None, "%s: %s" % (type(error).__name__, error))
+    finally:
+        if table is not None:
+            table.close()
+        results.put(message)
+
+
+# Wrap one search in a profiler and write the report to stream (stdout by default), returns its SearchResult
+# profiler "cprofile": time per function, sorted by cumulative time. "tracemalloc": the lines allocating the most memory
+def profileSearch(search, validMoves, profiler = "cprofile", stream = None, limit = 25):
+    stream = stream if stream is not None else sys.stdout
+    if profiler == "cprofile":
+        profile = cProfile.Profile()
+        result = profile.runcall(search.run, validMoves)
+        pstats.Stats(profile, stream = stream).sort_stats("cumulative").print_stats(limit)
+    elif profiler == "tracemalloc":
+        tracing = tracemalloc.is_tracing()
+        if not tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        try:
+            result = search.run(validMoves)
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+        finally:
+            if not tracing:
+                tracemalloc.stop()
+        stream.write("Traced memory: %d KiB now, %d KiB peak\n" % (current // 1024, peak // 1024))
+        for stat in snapshot.statistics("lineno")[:limit]:
+            stream.write(str(stat) + "\n")
+    else:
+        raise ValueError("Unknown profiler " + profiler + ", use cprofile or tracemalloc")
+    stream.write(result.stats.summary() + "\n")
+    return result
+
+
+# What a search hands back: the move, its score for the side to move and how deep it got
+class SearchResult():
+    def __init__(self, bestMove, score, depth, pv, nodes, elapsed, stats = None):
+        self.bestMove = bestMove
+        self.score = score
+        self.depth = depth
+        self.pv = pv # Principal variation, best line for both sides starting with bestMove (Move objects)
+        self.nodes = nodes
+        self.elapsed = elapsed
+        self.stats = stats # SearchStats of the search, None when the move did not come from a Search
+
+
+# Counters filled in while a search runs, to see where the time goes
+# nodes counts every node, qnodes the quiescence part of them
+# cutoffs / interiorNodes: how often a node that searched moves failed high
+# firstMoveCutoffs / cutoffs: how often the first move tried was already good enough (ordering quality)
+class SearchStats():
+    def __init__(self):
+        self.nodes = 0
+        self.qnodes = 0
+        self.interiorNodes = 0
+        self.cutoffs = 0
+        self.firstMoveCutoffs = 0
+        self.tableProbes = 0
+        self.tableHits = 0 # Probes that found the position
+        self.tableCutoffs = 0 # Hits deep enough to answer without searching
+        self.tablebaseProbes = 0
+        self.tablebaseHits = 0
+        self.draws = 0 # Nodes scored as repetition or fifty move draws without searching
+        self.iterations = [] # (depth, score, nodes, seconds) of every finished iteration
+        self.elapsed = 0
+
+    @property
+    def nps(self):
+        return self.nodes / self.elapsed if self.elapsed > 0 else 0
+
+    @property
+    def cutoffRate(self):
+        return self.cutoffs / self.interiorNodes if self.interiorNodes else 0
+
+    @property
+    def firstMoveCutoffRate(self):
+        return self.firstMoveCutoffs / self.cutoffs if self.cutoffs else 0
+
+    @property
+    def tableHitRate(self):
+        return self.tableHits / self.tableProbes if self.tableProbes else 0
+
+    @property
+    def tablebaseHitRate(self):
+        return self.tablebaseHits / self.tablebaseProbes if self.tablebaseProbes else 0
+
+    # Add the counters of another search (a Lazy SMP helper) to these, the first iterations merged in are kept
+    def merge(self, other):
+        for name in ("nodes", "qnodes", "interiorNodes", "cutoffs", "firstMoveCutoffs", "tableProbes", "tableHits",
+                     "tableCutoffs", "tablebaseProbes", "tablebaseHits", "draws"):
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        if not self.iterations:
+            self.iterations = list(other.iterations)
+        self.elapsed = max(self.elapsed, other.elapsed)
+
+    # Plain dict of the counters and rates, for logs and JSON
+    def asDict(self):
+        return {"nodes": self.nodes, "qnodes": self.qnodes, "nps": round(self.nps), "elapsed": round(self.elapsed, 4),
+                "cutoffRate": round(self.cutoffRate, 4), "firstMoveCutoffRate": round(self.firstMoveCutoffRate, 4),
+                "tableProbes": self.tableProbes, "tableHitRate": round(self.tableHitRate, 4), "tableCutoffs": self.tableCutoffs,
+                "tablebaseProbes": self.tablebaseProbes, "tablebaseHitRate": round(self.tablebaseHitRate, 4), "draws": self.draws,
+                "iterations": [{"depth": depth, "score": score, "nodes": nodes, "time": round(seconds, 4)}
+                               for depth, score, nodes, seconds in self.iterations]}
+
+    def summary(self):
+        lines = ["nodes %d (quiescence %d) in %.3f s, %d nps" % (self.nodes, self.qnodes, self.elapsed, self.nps),
+                 "beta cutoffs %.1f%% of interior nodes, %.1f%% on the first move" % (100 * self.cutoffRate, 100 * self.firstMoveCutoffRate),
+                 "table hits %.1f%% of %d probes (%d cutoffs), tablebase hits %.1f%% of %d probes" % (
+                     100 * self.tableHitRate, self.tableProbes, self.tableCutoffs, 100 * self.tablebaseHitRate, self.tablebaseProbes),
+                 "repetition / fifty move draws %d" % self.draws]
+        lines += ["depth %d: score %d, %d nodes, %.3f s" % iteration for iteration in self.iterations]
+        return "\n".join(lines)
+
+
+# Raised inside the search when the time or node budget runs out
+class SearchAborted(Exception):
+    pass
+
+
+# One search over one game state, every bit of search state lives here instead of in globals
+# Inside the search moves are packed codes, they are only wrapped as Move objects in the result
+class Search():
+    # table: TranspositionTable shared between searches (or processes), None searches without one
+    # stop: anything with is_set(), the search gives up once it is set (checked with the budget)
+    # startDepth: first iteration of the iterative deepening
+    # report: called with the SearchResult of every finished iteration (progress output), its stats are live
+    # evaluation: static evaluation (white's point of view) used at the leaves, Evaluation.evaluate by default
+    def __init__(self, gamestate, maxDepth, timeLimit = None, nodeLimit = None, ordering = None, table = None, stop = None,
+                 startDepth = 1, report = None, evaluation = evaluate):
+        self.gamestate = gamestate
+        self.evaluation = evaluation
+        self.report = report
+        self.table = table
+        self.tablebase = tablebase
+        self.stop = stop
+        self.startDepth = min(startDepth, maxDepth)
+        self.ordering = ordering if ordering is not None else MoveOrderer(piecesScore, MAX_PLY)
+        self.maxDepth = maxDepth
+        self.timeLimit = timeLimit
+        self.nodeLimit = nodeLimit
+        self.nodes = 0
+        self.stats = SearchStats()
+        self.startTime = 0
+        self.checkBudget = False # Off during depth 1 so there is always a move to return
+        self.rootPly = 0
+        self.nextCheck = 0
+        self.pvTable = [[] for _ in range(MAX_PLY + 1)]
+        self.prevPV = [] # Principal variation of the last finished iteration, searched first
+
+    def run(self, validMoves):
+        self.startTime = time.perf_counter()
+        self.rootPly = len(self.gamestate.moveLogs)
+        result = SearchResult(validMoves[0] if validMoves else None, 0, 0, [], 0, 0, self.stats)
+        rootMoves = [move.code if isinstance(move, Move) else move for move in validMoves]
+        if not rootMoves:
+            return result
+        self.ordering.newSearch()
+        if self.table is not None:
+            self.table.newSearch()
+
+        for depth in range(self.startDepth, self.maxDepth + 1):
+            self.checkBudget = depth > self.startDepth
+            try:
+                score = self.negamax(rootMoves, depth, 0, -CHECKMATE - 1, CHECKMATE + 1, True)
+            except SearchAborted:
+                # Unwind whatever the aborted iteration left on the board
+                while len(self.gamestate.moveLogs) > self.rootPly:
+                    self.gamestate.undoMove()
+                break
+            pv = list(self.pvTable[0])
+            elapsed = time.perf_counter() - self.startTime
+            result = SearchResult(Move.fromCode(pv[0]), score, depth, [Move.fromCode(code) for code in pv], self.nodes,
+                                  elapsed, self.stats)
+            self.stats.iterations.append((depth, score, self.nodes, elapsed))
+            self.stats.nodes, self.stats.elapsed = self.nodes, elapsed
+            self.prevPV = pv
+            if self.report is not None:
+                self.report(result)
+
+            # Stop once a forced mate is found
+            if abs(score) >= CHECKMATE - MAX_PLY or self.outOfBudget():
+                break
+
+        result.nodes = self.stats.nodes = self.nodes
+        result.elapsed = self.stats.elapsed = time.perf_counter() - self.startTime
+        return result
+
+    def outOfBudget(self):
+        if self.stop is not None and self.stop.is_set():
+            return True
+        if self.nodeLimit is not None and self.nodes >= self.nodeLimit:
+            return True
+        return self.timeLimit is not None and time.perf_counter() - self.startTime >= self.timeLimit
+
+    # Count a node and give up once the budget is spent
+    def visitNode(self):
+        self.nodes += 1
+        if self.checkBudget and self.nodes >= self.nextCheck:
+            self.nextCheck = self.nodes + 256 # Reading the clock every node is too slow
+            if self.nodeLimit is not None:
+                self.nextCheck = min(self.nextCheck, self.nodeLimit)
+            if self.outOfBudget():
+                raise SearchAborted()
+
+    # Score from the side to move's point of view, the opponent's best is our worst
+    # onPV is True while every move so far follows the previous iteration's principal variation
+    # moves is the root move list, below the root moves come from the staged picker as they are needed
+    def negamax(self, moves, depth, ply, alpha, beta, onPV):
+        gamestate = self.gamestate
+        ordering = self.ordering
+        stats = self.stats
+        self.visitNode()
+        self.pvTable[ply] = []
+
+        # A repeated position or fifty moves without progress is a draw, the line below it needs no search
+        # Once is enough for a repetition: whatever made it worth repeating can be repeated again
+        if ply > 0 and gamestate.halfmoveClock >= 4 and (gamestate.isRepetition() or gamestate.halfmoveClock >= 100
+                                                         and gamestate.isFiftyMoveDraw()):
+            stats.draws += 1
+            return STALEMATE
+
+        # Few enough pieces left: the tablebase knows the exact result (never at the root, a move is needed there)
+        if self.tablebase is not None and ply > 0 and popCount(gamestate.occupied) <= TABLEBASE_PIECES:
+            stats.tablebaseProbes += 1
+            plies = self.tablebase.probe(gamestate)
+            if plies is not None:
+                stats.tablebaseHits += 1
+                if plies > 0:
+                    return CHECKMATE - ply - plies
+                if plies < 0:
+                    return -(CHECKMATE - ply + plies)
+                return STALEMATE
+
+        # A deep enough stored result for this position can answer straight away (never at the root)
+        table = self.table
+        hashMove = None
+        if table is not None:
+            stats.tableProbes += 1
+            entry = table.probe(gamestate.zobristKey)
+            if entry:
+                stats.tableHits += 1
+                hashMove = (entry & MOVE_MASK) or None
+                if ply > 0 and entry >> DEPTH_SHIFT & 0xFF >= depth:
+                    score = scoreFromTable((entry >> SCORE_SHIFT & SCORE_MASK) - SCORE_OFFSET, ply)
+                    bound = entry >> BOUND_SHIFT & 3
+                    if bound == EXACT or (bound == LOWER and score >= beta) or (bound == UPPER and score <= alpha):
+                        stats.tableCutoffs += 1
+                        if hashMove is not None:
+                            self.pvTable[ply] = [hashMove]
+                        return score
+        alphaOrig = alpha
+        bestMove = None
+
+        pvMove = self.prevPV[ply] if onPV and ply < len(self.prevPV) else None
+        if pvMove is None:
+            pvMove = hashMove
+        if moves is not None:
+            moves = ordering.orderMoves(moves, ply, pvMove)
+        else:
+            moves = gamestate.stagedMoves(pvMove, ordering.killerMoves(ply), lambda move: ordering.scoreMove(move, ply))
+
+        searched = 0
+        for move in moves:
+            searched += 1
             gamestate.makeMoves(move)
-            
-            # What is the next move
-            nextMoves = gamestate.getValidateMoves()
-            score = findMoveMinMax(gamestate, nextMoves, depth - 1, not whiteToMove)
-
-            # Update maxscore
-            if score > max_score:
-                max_score = score
-
-                # At the first depth:
-                if depth == DEPTH:
-                    nextMove = move
+            if depth > 1:
+                childOnPV = pvMove is not None and move == pvMove
+                score = -self.negamax(None, depth - 1, ply + 1, -beta, -alpha, childOnPV)
+            else:
+                score = -self.quiescence(ply + 1, -beta, -alpha)
             gamestate.undoMove()
-        return max_score
 
-    # If black to move
-    else:
-        min_score = CHECKMATE
-        for move in validMoves:
+            if score > alpha:
+                alpha = score
+                bestMove = move
+                self.pvTable[ply] = [move] + self.pvTable[ply + 1]
+                if alpha >= beta:
+                    ordering.recordCutoff(move, ply, depth)
+                    stats.cutoffs += 1
+                    stats.firstMoveCutoffs += searched == 1
+                    break
+
+        if not searched:
+            return -(CHECKMATE - ply) if gamestate.inCheck() else STALEMATE
+        stats.interiorNodes += 1
+        if table is not None:
+            bound = LOWER if alpha >= beta else (EXACT if alpha > alphaOrig else UPPER)
+            table.store(gamestate.zobristKey, bestMove if bestMove is not None else hashMove, scoreToTable(alpha, ply), depth, bound)
+        return alpha
+
+    # Quiescence search: keep resolving captures at the leaves so trades are never cut in half
+    # Standing pat (taking the static score) is allowed unless in check, then every evasion is tried
+    # Captures the static exchange says lose material are not searched at all
+    def quiescence(self, ply, alpha, beta):
+        gamestate = self.gamestate
+        self.visitNode()
+        self.stats.qnodes += 1
+        self.pvTable[ply] = []
+        turnMultiplier = 1 if gamestate.whiteToMove else -1
+        if ply >= MAX_PLY:
+            return turnMultiplier * self.evaluation(gamestate)
+
+        inCheck = gamestate.inCheck()
+        moves = gamestate.generateMoves() if inCheck else None
+        if inCheck:
+            if not moves:
+                return -(CHECKMATE - ply)
+        else:
+            standPat = turnMultiplier * self.evaluation(gamestate)
+            if standPat >= beta:
+                return standPat
+            alpha = max(alpha, standPat)
+            moves = [move for move in gamestate.generateMoves(quiets = False)
+                     if gamestate.staticExchange(move) >= 0]
+
+        for move in self.ordering.orderMoves(moves, ply):
             gamestate.makeMoves(move)
+            score = -self.quiescence(ply + 1, -beta, -alpha)
+            gamestate.undoMove()
 
-            # Next move
-            nextMoves = gamestate.getValidateMoves()
-            score = findMoveMinMax(gamestate, nextMoves, depth - 1, not whiteToMove)
+            if score > alpha:
+                alpha = score
+                self.pvTable[ply] = [move] + self.pvTable[ply + 1]
+                if alpha >= beta:
+                    break
+        return alpha
 
-            # Update min score
-            if score < min_score:
-                min_score = score
 
-                # At the first depth:
-                if depth == DEPTH:
-                    nextMove = move
-            gamestate.undoMove()
-        return min_score
+# Mate scores count plies from the root, the table keeps them as plies from the stored position
+def scoreToTable(score, ply):
+    if score >= CHECKMATE - MAX_PLY:
+        return score + ply
+    if score <= -(CHECKMATE - MAX_PLY):
+        return score - ply
+    return score
+
+
+def scoreFromTable(score, ply):
+    if score >= CHECKMATE - MAX_PLY:
+        return score - ply
+    if score <= -(CHECKMATE - MAX_PLY):
+        return score + ply
+    return score
 
 
 # Score the board - positive trade is good for player white, a negative score is good for black
@@ -144,24 +575,5 @@ def scoreBoard(gamestate):
     elif gamestate.staleMate:
         return STALEMATE
 
-    score = 0
-    for row in gamestate.board:
-        for sq in row:
-            if sq[0] == 'w':
-                score += piecesScore[sq[1]]
-            elif sq[0] == 'b':
-                score -= piecesScore[sq[1]]
-
-    return score
-
-# Score the board based on mateial
-def scoreMaterial(board):
-    score = 0
-    for row in board:
-        for sq in row:
-            if sq[0] == 'w':
-                score += piecesScore[sq[1]]
-            elif sq[0] == 'b':
-                score -= piecesScore[sq[1]]
-
-    return score
+    # Material and piece squares, kept up to date by the game state so this is O(1)
+    return evaluate(gamestate)
@@ -7,192 +7,555 @@ Responsibilities:
 """ 
 
 import numpy as np 
-from ChessGame.Move import Move
-from ChessGame.CastleRight import CastleRights
+from ChessGame.Move import (Move, PIECES, PIECE_CODES, MOVED_BITS, CAPTURED_BITS, TO_SHIFT, PROMOTION_SHIFT, ENPASSANT_FLAG,
+                            CASTLING_FLAG, PROMOTION_MASK, CAPTURED_MASK, MOVED_SHIFT, CAPTURED_SHIFT)
+from ChessGame.CastleRight import WKS, WQS, BKS, BQS, CASTLING_KEEP, parseCastling, castlingFen
+from ChessGame.Zobrist import PIECE_KEYS, SIDE_KEY, CASTLING_KEYS, enpassantKey
+from ChessGame.Evaluation import PST_MG, PST_EG, PHASE, SEE_VALUES
+from ChessGame.Bitboard import (FULL, KNIGHT_ATTACKS, KING_ATTACKS, PAWN_ATTACKS, ROOK_RAYS, BISHOP_RAYS, BETWEEN, LINE, squares,
+                                rookAttacks, bishopAttacks, queenAttacks)
+
+# First and last rank, a pawn push onto them is a promotion and counts as a tactical move
+PROMOTION_RANKS = 0xFF | 0xFF << 56
+
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+# Castling right, king, rook and the rook's home square (the king's is on the same rank, e file)
+CASTLING_HOMES = [(WKS, "wK", "wR", 63), (WQS, "wK", "wR", 56), (BKS, "bK", "bR", 7), (BQS, "bK", "bR", 0)]
+
+# (row, col) of every square, shared so moves never have to build these tuples
+SQUARE_COORDS = [(sq >> 3, sq & 7) for sq in range(64)]
+
+# What a move cannot take back is saved before the move is played and restored by undo, in two preallocated
+# stacks sharing one index: the Zobrist key as it is (no new int) and the small fields packed into one word
+#   bits  0 - 3   castling rights (see CastleRight)
+#   bits  4 - 9   en passant square, 0 for none (a8 can never be one)
+#   bits 10 - 25  halfmove clock
+# The captured piece is in the move code itself
+EP_SHIFT = 4
+CLOCK_SHIFT = 10
+CLOCK_MASK = 0xFFFF
+STACK_SIZE = 1024 # Plies the stacks start with, they double if a game ever gets longer
 
 class GameState(): 
-    def __init__(self): 
-        # 8 * 8 2 Dimensional Board 
-        self.board = np.full((8, 8), "--", dtype = "<U2") 
-        # Black Pieces 
-        self.board[0] = ["bR", "bN", "bB", "bQ", "bK", "bB", "bN", "bR"] 
-        self.board[1] = ["bP"] * 8
-        # White Pieces 
-        self.board[6] = ["wP"] * 8 
-        self.board[7] = ["wR", "wN", "wB", "wQ", "wK", "wB", "wN", "wR"] 
-        self.whiteToMove = True 
-        self.moveLogs = []
-        self.whiteKingLocation = (7, 4)
-        self.blackKingLocation = (0, 4)
+    def __init__(self, fen = START_FEN): 
+        # 8 * 8 2 Dimensional Board kept as plain lists, NumPy scalar access is too slow for search
+        self.mailbox = [["--"] * 8 for _ in range(8)]
+
+        # Bitboards: one 64 bit set per piece, occupancy per colour and for the whole board
+        # Bit (row * 8 + col) is set when the square is occupied
+        self.bitboards = {piece: 0 for piece in PIECES}
+        self.colourBoards = {'w': 0, 'b': 0}
+        self.occupied = 0
+        # Zobrist key of the position, pieces are hashed in and out by putPiece / removePiece
+        self.zobristKey = 0
+        # Irreversible state of every earlier position (see above), stackTop is the number of entries in use
+        self.keyStack = [0] * STACK_SIZE
+        self.stateStack = [0] * STACK_SIZE
+        self.stackTop = 0
+        # Material + piece square totals (white minus black) and game phase, see Evaluation
+        self.mgScore = 0
+        self.egScore = 0
+        self.phase = 0
+
+        # NumPy view of the board for drawing, rebuilt lazily after the position changes
+        self.boardView = None
+        self.boardDirty = True
+
+        self.moveLogs = [] # Packed move codes, Move.fromCode turns one back into a Move
         self.checkMate = False
         self.staleMate = False
 
-        # En Passant
+        # FEN fields: pieces, side to move, castling rights, en passant target and the two move counters
+        fields = fen.split()
+        if len(fields) == 4: # Counters are often left out
+            fields += ["0", "1"]
+        ranks = fields[0].split("/") if len(fields) == 6 else []
+        if len(ranks) != 8 or fields[1] not in ("w", "b"):
+            raise ValueError("Invalid FEN: " + fen)
+
+        for r, rank in enumerate(ranks):
+            c = 0
+            for char in rank:
+                if char.isdigit():
+                    c += int(char)
+                elif char.upper() in "PNBRQK" and c < 8:
+                    self.putPiece(r, c, ("w" if char.isupper() else "b") + char.upper())
+                    c += 1
+                else:
+                    raise ValueError("Invalid FEN: " + fen)
+            if c != 8:
+                raise ValueError("Invalid FEN: " + fen)
+        if self.bitboards['wK'] & (self.bitboards['wK'] - 1) or self.bitboards['bK'] & (self.bitboards['bK'] - 1) \
+                or not self.bitboards['wK'] or not self.bitboards['bK']:
+            raise ValueError("Invalid FEN, each side needs exactly one king: " + fen)
+        if (self.bitboards['wP'] | self.bitboards['bP']) & PROMOTION_RANKS:
+            raise ValueError("Invalid FEN, pawn on the first or last rank: " + fen)
+
+        self.whiteToMove = fields[1] == "w"
+        whiteKing, blackKing = self.bitboards['wK'].bit_length() - 1, self.bitboards['bK'].bit_length() - 1
+        self.whiteKingLocation = SQUARE_COORDS[whiteKing]
+        self.blackKingLocation = SQUARE_COORDS[blackKing]
+
+        # En Passant, the target square is the one the enemy pawn just skipped: on the sixth rank when white
+        # is to move (third for black), empty, with that pawn right in front of it and its start square empty
         self.enpassantPossbile = () # Tuple where its possible to en passant
-
-        # Checking whose has castling rights
-        self.currentCastlingRight = CastleRights(True, True, True, True)
-        self.castlingRightLog = [CastleRights(self.currentCastlingRight.wks, self.currentCastlingRight.bks, self.currentCastlingRight.wqs, self.currentCastlingRight.bqs)]
-
+        if fields[3] != "-":
+            if len(fields[3]) != 2 or fields[3][0] not in Move.filesToCols or fields[3][1] != ("6" if self.whiteToMove else "3"):
+                raise ValueError("Invalid FEN, bad en passant square: " + fen)
+            epSq = Move.ranks[fields[3][1]] * 8 + Move.filesToCols[fields[3][0]]
+            forward = 8 if self.whiteToMove else -8 # Towards the pawn that moved two squares
+            enemyPawn = self.bitboards['bP' if self.whiteToMove else 'wP']
+            if self.occupied >> epSq & 1 or self.occupied >> (epSq - forward) & 1 or not enemyPawn >> (epSq + forward) & 1:
+                raise ValueError("Invalid FEN, no pawn can have just moved past the en passant square: " + fen)
+            self.enpassantPossbile = SQUARE_COORDS[epSq]
+
+        # Checking whose has castling rights, a 4 bit mask
+        # A right whose king or rook is not on its home square can never be used, so it is dropped
+        self.castlingRights = parseCastling(fields[2])
+        for right, king, rook, rookSq in CASTLING_HOMES:
+            if not (self.bitboards[king] >> (rookSq & ~7 | 4) & 1 and self.bitboards[rook] >> rookSq & 1):
+                self.castlingRights &= ~right
+
+        # Plies since the last capture or pawn move, and the move number (goes up after black moves)
+        if not (fields[4].isdigit() and fields[5].isdigit()):
+            raise ValueError("Invalid FEN, bad move counters: " + fen)
+        self.halfmoveClock = min(int(fields[4]), CLOCK_MASK)
+        self.fullmoveNumber = int(fields[5])
+
+        self.zobristKey = self.computeZobristKey()
+
+    # Game state set up from a FEN string
+    @classmethod
+    def fromFen(cls, fen):
+        return cls(fen)
+
+    # FEN string of the current position
+    def toFen(self):
+        ranks = []
+        for row in self.mailbox:
+            rank, empty = "", 0
+            for piece in row:
+                if piece == "--":
+                    empty += 1
+                    continue
+                if empty:
+                    rank += str(empty)
+                    empty = 0
+                rank += piece[1] if piece[0] == "w" else piece[1].lower()
+            ranks.append(rank + (str(empty) if empty else ""))
+
+        castling = castlingFen(self.castlingRights)
+        enpassant = Move.colsToFiles[self.enpassantPossbile[1]] + Move.rowsToRanks[self.enpassantPossbile[0]] if self.enpassantPossbile else "-"
+        return " ".join(["/".join(ranks), "w" if self.whiteToMove else "b", castling, enpassant,
+                         str(self.halfmoveClock), str(self.fullmoveNumber)])
+
+    # Board as an 8 * 8 NumPy string array, derived from the bitboards for drawing
+    @property
+    def board(self):
+        if self.boardDirty:
+            self.boardView = np.array(self.mailbox, dtype = "<U2")
+            self.boardDirty = False
+        return self.boardView
+
+    # Put a piece on an empty square
+    def putPiece(self, r, c, piece):
+        sq = r * 8 + c
+        bit = 1 << sq
+        self.mailbox[r][c] = piece
+        self.bitboards[piece] |= bit
+        self.colourBoards[piece[0]] |= bit
+        self.occupied |= bit
+        self.zobristKey ^= PIECE_KEYS[piece][sq]
+        self.mgScore += PST_MG[piece][sq]
+        self.egScore += PST_EG[piece][sq]
+        self.phase += PHASE[piece]
+
+    # Take whatever is on the square off the board and return it
+    def removePiece(self, r, c):
+        piece = self.mailbox[r][c]
+        if piece != '--':
+            sq = r * 8 + c
+            bit = 1 << sq
+            self.mailbox[r][c] = '--'
+            self.bitboards[piece] ^= bit
+            self.colourBoards[piece[0]] ^= bit
+            self.occupied ^= bit
+            self.zobristKey ^= PIECE_KEYS[piece][sq]
+            self.mgScore -= PST_MG[piece][sq]
+            self.egScore -= PST_EG[piece][sq]
+            self.phase -= PHASE[piece]
+        return piece
     
+    # Play a move, given as a Move or as its packed code
     def makeMoves(self, move):
-        self.board[move.startRow][move.startCol] = '--'
-        self.board[move.endRow][move.endCol] = move.pieceMoved
-        self.moveLogs.append(move) # Log the move
+        code = move if move.__class__ is int else move.code
+        start, end = code & 63, code >> TO_SHIFT & 63
+        startRow, startCol, endRow, endCol = start >> 3, start & 7, end >> 3, end & 7
+        pieceMoved = PIECE_CODES[code >> MOVED_SHIFT & 15]
+
+        # Save what undo cannot work out from the move, then hash out the side, castling rights and
+        # en passant square, they are hashed back in once updated
+        enpassant = self.enpassantPossbile
+        top = self.stackTop
+        if top == len(self.keyStack):
+            self.keyStack += [0] * top
+            self.stateStack += [0] * top
+        self.keyStack[top] = self.zobristKey
+        self.stateStack[top] = self.halfmoveClock << CLOCK_SHIFT | (enpassant[0] * 8 + enpassant[1] if enpassant else 0) << EP_SHIFT \
+            | self.castlingRights
+        self.stackTop = top + 1
+        self.zobristKey ^= SIDE_KEY ^ CASTLING_KEYS[self.castlingRights] ^ (self.enpassantZobrist() if enpassant else 0)
+
+        self.removePiece(startRow, startCol)
+        self.removePiece(endRow, endCol)
+        self.moveLogs.append(code) # Log the move
+        self.boardDirty = True
         self.whiteToMove = not self.whiteToMove # Set up the opposite
 
         # Update location of the king when its move
-        if move.pieceMoved == 'wK':
-            self.whiteKingLocation = (move.endRow, move.endCol)
-        if move.pieceMoved == 'bK':
-            self.blackKingLocation = (move.endRow, move.endCol) 
-
-        # Pawn promotion logic -> Always make it a queen
-        if move.isPawnPromotion == True:
-            self.board[move.endRow][move.endCol] = move.pieceMoved[0] + "Q" # Promote at end rank
+        if pieceMoved == 'wK':
+            self.whiteKingLocation = SQUARE_COORDS[end]
+        if pieceMoved == 'bK':
+            self.blackKingLocation = SQUARE_COORDS[end]
+
+        # Pawn promotion logic -> Queen unless the move asks for another piece
+        if code & PROMOTION_MASK:
+            self.putPiece(endRow, endCol, pieceMoved[0] + Move.promotionPieces[(code >> PROMOTION_SHIFT & 7) - 1]) # Promote at end rank
+        else:
+            self.putPiece(endRow, endCol, pieceMoved)
         
         # Logic for en passant
-        if move.isEnpassantMove:
-            self.board[move.startRow][move.endCol] = '--'
+        if code & ENPASSANT_FLAG:
+            self.removePiece(startRow, endCol)
         
         # Update game state for every move possible for en passant
-        if move.pieceMoved[1] == "P" and abs(move.startRow - move.endRow) == 2: # only 2 sq on pawn advance
-            self.enpassantPossbile = ((move.startRow + move.endRow) // 2, move.startCol)
+        if pieceMoved[1] == "P" and abs(startRow - endRow) == 2: # only 2 sq on pawn advance
+            self.enpassantPossbile = SQUARE_COORDS[(start + end) >> 1]
         else:
             self.enpassantPossbile = ()
+
+        # Move counters, a pawn move or a capture resets the fifty move count
+        if pieceMoved[1] == "P" or code >> CAPTURED_SHIFT & 15:
+            self.halfmoveClock = 0
+        else:
+            self.halfmoveClock += 1
+        if self.whiteToMove: # Black just moved
+            self.fullmoveNumber += 1
         
         # Caslte Move
-        if move.isCastlingMove:
-            if move.endCol - move.startCol == 2: # King side castle
-                self.board[move.endRow][move.endCol - 1] = self.board[move.endRow][move.endCol + 1] # moves the rook
-                self.board[move.endRow][move.endCol + 1] = "--"
+        if code & CASTLING_FLAG:
+            if endCol - startCol == 2: # King side castle
+                self.putPiece(endRow, endCol - 1, self.removePiece(endRow, endCol + 1)) # moves the rook
             else: # Queen side castle
-                self.board[move.endRow][move.endCol + 1 ] = self.board[move.endRow][move.endCol - 2] # Moves the rook
-                self.board[move.endRow][move.endCol - 2] = "--"
+                self.putPiece(endRow, endCol + 1, self.removePiece(endRow, endCol - 2)) # Moves the rook
         # Update castling right
         # If the rook or king move, we NEED to update it
-        self.updateCastleRight(move)
-        self.castlingRightLog.append(CastleRights(self.currentCastlingRight.wks, self.currentCastlingRight.bks, self.currentCastlingRight.wqs, self.currentCastlingRight.bqs))
+        self.updateCastleRight(code)
+        self.zobristKey ^= CASTLING_KEYS[self.castlingRights] ^ (self.enpassantZobrist() if self.enpassantPossbile else 0)
 
     
 
-    # Update castling right
-    def updateCastleRight(self, move):
-        # If they move white king
-        if move.pieceMoved == 'wK':
-            self.currentCastlingRight.wks = False
-            self.currentCastlingRight.wqs = False
-        # IF they move the black king
-        elif move.pieceMoved == "bK":
-            self.currentCastlingRight.bks = False
-            self.currentCastlingRight.bqs = False
-        # If they moved the white rook
-        elif move.pieceMoved == "wR":
-            # White position
-            if move.startRow == 7:
-                # If its a left rook
-                if move.startCol == 0: 
-                    self.currentCastlingRight.wqs = False
-                # If its a right rook
-                elif move.startCol == 7:
-                    self.currentCastlingRight.wks = False
-                            
-        # If they moved a black rook
-        elif move.pieceMoved == "bR":
-            # White position
-            if move.startRow == 0:
-                # If its a left rook
-                if move.startCol == 0: 
-                    self.currentCastlingRight.bqs = False
-                # If its a right rook
-                elif move.startCol == 7:
-                    self.currentCastlingRight.bks = False
-        
+    # Zobrist key of the en passant square, 0 unless a pawn of the side to move can take on it
+    def enpassantZobrist(self):
+        return enpassantKey(self.enpassantPossbile, self.whiteToMove, self.bitboards['wP' if self.whiteToMove else 'bP'])
+
+    # Full Zobrist key of the current position, the incremental key must always equal it
+    def computeZobristKey(self):
+        key = CASTLING_KEYS[self.castlingRights] ^ self.enpassantZobrist()
+        if not self.whiteToMove:
+            key ^= SIDE_KEY
+        for piece, bb in self.bitboards.items():
+            for sq in squares(bb):
+                key ^= PIECE_KEYS[piece][sq]
+        return key
+
+    # True once the current position has occurred times times before (threefold repetition is times = 2)
+    # Only positions since the last capture or pawn move can come back, and only every other one has the
+    # same side to move, so the scan is short even in long games
+    def isRepetition(self, times = 1):
+        key = self.zobristKey
+        history = self.keyStack
+        top = self.stackTop
+        found = 0
+        for i in range(top - 4, max(top - self.halfmoveClock, 0) - 1, -2):
+            if history[i] == key:
+                found += 1
+                if found >= times:
+                    return True
+        return False
+
+    # Fifty moves by each side without a capture or pawn move, unless the last of them mated
+    def isFiftyMoveDraw(self):
+        return self.halfmoveClock >= 100 and (not self.inCheck() or bool(self.generateMoves()))
 
+    # Update castling right, from the packed code of the move just played
+    # Moving the king or a rook, or capturing a rook on its corner, clears bits of the mask (see CastleRight)
+    def updateCastleRight(self, code):
+        self.castlingRights &= CASTLING_KEEP[code & 63] & CASTLING_KEEP[code >> TO_SHIFT & 63]
 
     def undoMove(self):
         if len(self.moveLogs) != 0: # There is move to undo
-            move = self.moveLogs.pop()
-            self.board[move.startRow][move.startCol] = move.pieceMoved
-            self.board[move.endRow][move.endCol] = move.pieceCaptured
+            code = self.moveLogs.pop()
+            start, end = code & 63, code >> TO_SHIFT & 63
+            startRow, startCol, endRow, endCol = start >> 3, start & 7, end >> 3, end & 7
+            pieceMoved = PIECE_CODES[code >> MOVED_SHIFT & 15]
+            pieceCaptured = PIECE_CODES[code >> CAPTURED_SHIFT & 15]
+            self.removePiece(endRow, endCol)
+            self.putPiece(startRow, startCol, pieceMoved)
+            if pieceCaptured != '--' and not code & ENPASSANT_FLAG:
+                self.putPiece(endRow, endCol, pieceCaptured)
+            self.boardDirty = True
             self.whiteToMove = not self.whiteToMove
-            if move.pieceMoved == 'wK':
-                self.whiteKingLocation = (move.startRow, move.startCol)
-            if move.pieceMoved == 'bK':
-                self.blackKingLocation = (move.startRow, move.startCol) 
+            if pieceMoved == 'wK':
+                self.whiteKingLocation = SQUARE_COORDS[start]
+            if pieceMoved == 'bK':
+                self.blackKingLocation = SQUARE_COORDS[start]
             
-            # restore en passant state
-            self.enpassantPossbile = move.prevEnpassantPossbile
+            # restore en passant square, castling rights and halfmove clock from before the move
+            self.stackTop -= 1
+            state = self.stateStack[self.stackTop]
+            enpassant = state >> EP_SHIFT & 63
+            self.enpassantPossbile = SQUARE_COORDS[enpassant] if enpassant else ()
+            self.castlingRights = state & 15
+            self.halfmoveClock = state >> CLOCK_SHIFT & CLOCK_MASK
+            if not self.whiteToMove: # Undoing a black move
+                self.fullmoveNumber -= 1
 
             # restore captured pawn
-            if move.isEnpassantMove:
-                self.board[move.endRow][move.endCol] = "--"
-                self.board[move.startRow][move.endCol] = move.pieceCaptured
+            if code & ENPASSANT_FLAG:
+                self.putPiece(startRow, endCol, pieceCaptured)
             
-            # Undo castling rights move:
-            self.castlingRightLog.pop()
-
-            # Set current castling rights to the last available ones
-            castleRights = self.castlingRightLog[-1]
-            self.currentCastlingRight = CastleRights(castleRights.wks, castleRights.bks, castleRights.wqs, castleRights.bqs)
-
             # Undo castling moves
-            if move.isCastlingMove:
-                if move.endCol - move.startCol == 2: # King side castling move
-                    self.board[move.endRow][move.endCol + 1] = self.board[move.endRow][move.endCol - 1]
-                    self.board[move.endRow][move.endCol - 1] = "--"
+            if code & CASTLING_FLAG:
+                if endCol - startCol == 2: # King side castling move
+                    self.putPiece(endRow, endCol + 1, self.removePiece(endRow, endCol - 1))
                 else: # Queen side
-                    self.board[move.endRow][move.endCol - 2] = self.board[move.endRow][move.endCol + 1]
-                    self.board[move.endRow][move.endCol + 1] = "--"
+                    self.putPiece(endRow, endCol - 2, self.removePiece(endRow, endCol + 1))
+
+            # Back to the key of the previous position, once every piece is back in place
+            self.zobristKey = self.keyStack[self.stackTop]
             
             # Adding condition checkmate, stalemate for AI
             self.checkMate = False
             self.staleMate = False
         
 
+    # Legal moves wrapped as Move objects, for the UI and anything that wants to read them
     def getValidateMoves(self):
-        # Tracking valid
-        # 1) Generate all moves
-        # 2) For each move, make the move
-        # 3) Generate all oppenent's moves
-        # 4) For each move, see if they are attacking ur king
-
-        tempEnpassantPossible = self.enpassantPossbile # Save valid en passant for quite generate all valid moves
-        # Save the castlign rights
-        tempCastlingRights = CastleRights(self.currentCastlingRight.wks, self.currentCastlingRight.bks, self.currentCastlingRight.wqs, self.currentCastlingRight.bqs)
-
-
-        moves = self.getAllPossibleMoves()
+        return [Move.fromCode(code) for code in self.generateMoves()]
+
+    # Legal moves as packed codes, what the search works with
+    # captures: captures, en passant and every promotion. quiets: everything else, castling included
+    # Mate and stalemate are only flagged when both halves are generated
+    def generateMoves(self, captures = True, quiets = True):
+        # Legal moves are generated directly instead of make / undo filtering:
+        # 1) Find the pieces giving check and our pinned pieces up front
+        # 2) King moves go to squares the enemy does not attack (with the king lifted off the board)
+        # 3) In double check only the king can move
+        # 4) Otherwise every move must land on the check mask, pinned pieces stay on their pin line
+        ally, enemy = ('w', 'b') if self.whiteToMove else ('b', 'w')
+        own = self.colourBoards[ally]
+        occupied = self.occupied
+        kingBit = self.bitboards[ally + 'K']
+        kingSq = kingBit.bit_length() - 1
+        kr, kc = kingSq >> 3, kingSq & 7
+        moves = []
+
+        kingMoved = MOVED_BITS[ally + 'K']
+        targetMask = (self.colourBoards[enemy] if captures else 0) | (FULL ^ occupied if quiets else 0)
+
+        checkers = self.attackersTo(kingSq, enemy, occupied)
+        for sq in squares(KING_ATTACKS[kingSq] & targetMask):
+            if not self.isAttacked(sq, enemy, occupied ^ kingBit):
+                moves.append(kingSq | sq << TO_SHIFT | kingMoved | CAPTURED_BITS[self.mailbox[sq >> 3][sq & 7]])
+
+        if checkers & (checkers - 1) == 0: # Not in double check
+            if checkers:
+                checkMask = BETWEEN[kingSq][checkers.bit_length() - 1] | checkers
+            else:
+                checkMask = FULL
+                if quiets:
+                    self.getCastlingMoves(kr, kc, moves)
+            pinned = self.getPinnedPieces(kingSq, ally, enemy)
+
+            for sq in squares(own ^ kingBit):
+                r, c = sq >> 3, sq & 7
+                piece = self.mailbox[r][c][1]
+                mask = checkMask & LINE[kingSq][sq] if (pinned >> sq) & 1 else checkMask
+                if piece == 'P':
+                    self.getLegalPawnMoves(r, c, mask, ally, enemy, kingSq, moves, captures, quiets)
+                    continue
+                elif piece == 'N':
+                    targets = KNIGHT_ATTACKS[sq]
+                elif piece == 'B':
+                    targets = bishopAttacks(sq, occupied)
+                elif piece == 'R':
+                    targets = rookAttacks(sq, occupied)
+                else:
+                    targets = queenAttacks(sq, occupied)
+                self.addMoves(r, c, targets & targetMask & mask, moves)
 
-        # # Generates castling moves if its based on the allay colour
-        
-        # if self.whiteToMove:
-        #     self.getCastlingMoves(self.whiteKingLocation[0], self.whiteKingLocation[1], moves)
-        # else:
-        #     self.getCastlingMoves(self.blackKingLocation[0], self.blackKingLocation[1], moves)
-        
-        for i in range(len(moves) -1, -1, -1):
-            self.makeMoves(moves[i])
-            self.whiteToMove = not self.whiteToMove
-            if self.inCheck():
-                moves.remove(moves[i])
-            self.whiteToMove = not self.whiteToMove
-            self.undoMove()
-        
+        if not (captures and quiets):
+            return moves
         if len(moves) == 0:
-            if self.inCheck():
+            if checkers:
                 self.checkMate = True
             else:
                 self.staleMate = True
         else:
             self.checkMate = False
             self.staleMate = False
-
-        # Assign it back
-        self.enpassantPossbile = tempEnpassantPossible
-        self.currentCastlingRight = tempCastlingRights
         return moves
 
+    # Staged move picker: moves are generated one stage at a time and only once the stage before is used up
+    # 1) hashMove, 2) captures and promotions, 3) killers, 4) the remaining quiet moves
+    # scoreMove (for example MoveOrderer.scoreMove bound to a ply) sorts the captures and the quiets
+    # A cutoff on the hash move or a capture means the quiet moves are never generated at all
+    # The position may change between two steps as long as it is back when the next move is asked for
+    def stagedMoves(self, hashMove = None, killers = (), scoreMove = None):
+        if hashMove is not None and self.isLegal(hashMove):
+            yield hashMove
+        else:
+            hashMove = None
+
+        captures = self.generateMoves(quiets = False)
+        if scoreMove is not None:
+            captures.sort(key = scoreMove, reverse = True)
+        for move in captures:
+            if move != hashMove:
+                yield move
+
+        tried = [hashMove]
+        for killer in killers:
+            # Killers come from sibling positions, they have to be checked against this one
+            if killer is not None and killer not in tried and not killer & (CAPTURED_MASK | PROMOTION_MASK | CASTLING_FLAG) \
+                    and self.isLegal(killer):
+                tried.append(killer)
+                yield killer
+
+        quietMoves = self.generateMoves(captures = False)
+        if scoreMove is not None:
+            quietMoves.sort(key = scoreMove, reverse = True)
+        for move in quietMoves:
+            if move not in tried:
+                yield move
+
+    # Is the packed move legal here, without generating every move. Used for hash and killer moves
+    def isLegal(self, code):
+        if code & (ENPASSANT_FLAG | CASTLING_FLAG): # Rare, let the generator decide
+            return code in self.generateMoves(quiets = not code & ENPASSANT_FLAG, captures = not code & CASTLING_FLAG)
+        ally, enemy = ('w', 'b') if self.whiteToMove else ('b', 'w')
+        start, end = code & 63, code >> TO_SHIFT & 63
+        pieceMoved = PIECE_CODES[code >> MOVED_SHIFT & 15]
+        pieceCaptured = PIECE_CODES[code >> CAPTURED_SHIFT & 15]
+        if pieceMoved[0] != ally or self.mailbox[start >> 3][start & 7] != pieceMoved \
+                or self.mailbox[end >> 3][end & 7] != pieceCaptured or pieceCaptured[1] == 'K':
+            return False
+
+        # Can the piece get there
+        piece = pieceMoved[1]
+        occupied = self.occupied
+        if piece == 'P':
+            if bool(code & PROMOTION_MASK) != bool((PROMOTION_RANKS >> end) & 1):
+                return False
+            forward = -8 if ally == 'w' else 8
+            if pieceCaptured != '--':
+                reachable = (PAWN_ATTACKS[ally][start] >> end) & 1
+            else:
+                reachable = end == start + forward or (end == start + 2 * forward and start >> 3 == (6 if ally == 'w' else 1)
+                                                       and not (occupied >> (start + forward)) & 1)
+        elif code & PROMOTION_MASK:
+            return False
+        elif piece == 'N':
+            reachable = (KNIGHT_ATTACKS[start] >> end) & 1
+        elif piece == 'B':
+            reachable = (bishopAttacks(start, occupied) >> end) & 1
+        elif piece == 'R':
+            reachable = (rookAttacks(start, occupied) >> end) & 1
+        elif piece == 'Q':
+            reachable = (queenAttacks(start, occupied) >> end) & 1
+        else:
+            reachable = (KING_ATTACKS[start] >> end) & 1
+        if not reachable:
+            return False
+
+        # Our king may not be attacked once the move is played, a captured piece no longer attacks
+        kingSq = end if piece == 'K' else self.bitboards[ally + 'K'].bit_length() - 1
+        occupied = occupied ^ (1 << start) | (1 << end)
+        return not self.attackersTo(kingSq, enemy, occupied) & ~(1 << end)
+
+    # Bitboard of the pieces of colour that attack square sq, given an occupancy
+    def attackersTo(self, sq, colour, occupied):
+        bitboards = self.bitboards
+        attackers = ((PAWN_ATTACKS['b' if colour == 'w' else 'w'][sq] & bitboards[colour + 'P'])
+                     | (KNIGHT_ATTACKS[sq] & bitboards[colour + 'N'])
+                     | (KING_ATTACKS[sq] & bitboards[colour + 'K']))
+        straight = bitboards[colour + 'R'] | bitboards[colour + 'Q']
+        if ROOK_RAYS[sq] & straight:
+            attackers |= rookAttacks(sq, occupied) & straight
+        diagonal = bitboards[colour + 'B'] | bitboards[colour + 'Q']
+        if BISHOP_RAYS[sq] & diagonal:
+            attackers |= bishopAttacks(sq, occupied) & diagonal
+        return attackers
+
+    # Our pieces that are the only thing between our king and an enemy slider
+    def getPinnedPieces(self, kingSq, ally, enemy):
+        bitboards = self.bitboards
+        enemyOcc = self.colourBoards[enemy]
+        # Look through our own pieces from the king to find sliders lined up on it
+        snipers = ((rookAttacks(kingSq, enemyOcc) & (bitboards[enemy + 'R'] | bitboards[enemy + 'Q']))
+                   | (bishopAttacks(kingSq, enemyOcc) & (bitboards[enemy + 'B'] | bitboards[enemy + 'Q'])))
+        pinned = 0
+        for sq in squares(snipers):
+            blockers = BETWEEN[kingSq][sq] & self.occupied
+            if blockers and blockers & (blockers - 1) == 0 and blockers & self.colourBoards[ally]:
+                pinned |= blockers
+        return pinned
+
+    def getLegalPawnMoves(self, r, c, mask, ally, enemy, kingSq, moves, captures = True, quiets = True):
+        sq = r * 8 + c
+        forward, startRow = (-8, 6) if ally == 'w' else (8, 1)
+        one = sq + forward
+        # Pushes to the last rank promote and go with the captures
+        pushMask = mask & ((PROMOTION_RANKS if captures else 0) | (FULL ^ PROMOTION_RANKS if quiets else 0))
+        if not (self.occupied >> one) & 1:
+            self.addPawnMoves(r, c, (1 << one) & pushMask, moves)
+            if r == startRow and not (self.occupied >> (one + forward)) & 1: # 2 square pawn first move
+                self.addPawnMoves(r, c, (1 << (one + forward)) & pushMask, moves)
+
+        if not captures:
+            return
+        attacks = PAWN_ATTACKS[ally][sq]
+        self.addPawnMoves(r, c, attacks & self.colourBoards[enemy] & mask, moves)
+
+        # En passant can uncover the king along the rank, so replay it on the occupancy
+        if self.enpassantPossbile:
+            epRow, epCol = self.enpassantPossbile
+            epSq = epRow * 8 + epCol
+            if (attacks >> epSq) & 1:
+                capturedBit = 1 << (r * 8 + epCol)
+                occupied = (self.occupied ^ (1 << sq) ^ capturedBit) | (1 << epSq)
+                if not self.attackersTo(kingSq, enemy, occupied) & ~capturedBit:
+                    moves.append(self.enpassantCode(sq, epSq, ally))
+
+    # Get all valid castling moves for king at pos (r, c)
+    # The rook must still have its rights and the king may not be in, pass or land on an attacked square
+    def getCastlingMoves(self, r, c, moves):
+        if self.whiteToMove:
+            kingSide, queenSide, enemy = self.castlingRights & WKS, self.castlingRights & WQS, 'b'
+        else:
+            kingSide, queenSide, enemy = self.castlingRights & BKS, self.castlingRights & BQS, 'w'
+        sq = r * 8 + c
+        if not (kingSide or queenSide) or self.isAttacked(sq, enemy, self.occupied):
+            return
+        if kingSide and self.mailbox[r][c + 1] == '--' and self.mailbox[r][c + 2] == '--':
+            if not self.isAttacked(sq + 1, enemy, self.occupied) and not self.isAttacked(sq + 2, enemy, self.occupied):
+                moves.append(sq | (sq + 2) << TO_SHIFT | MOVED_BITS[self.mailbox[r][c]] | CASTLING_FLAG)
+        if queenSide and self.mailbox[r][c - 1] == '--' and self.mailbox[r][c - 2] == '--' and self.mailbox[r][c - 3] == "--":
+            if not self.isAttacked(sq - 1, enemy, self.occupied) and not self.isAttacked(sq - 2, enemy, self.occupied):
+                moves.append(sq | (sq - 2) << TO_SHIFT | MOVED_BITS[self.mailbox[r][c]] | CASTLING_FLAG)
+
     
     # Determine if the player is in check
     def inCheck(self):
@@ -201,184 +564,99 @@ class GameState():
         else:
             return self.sqUnderAttack(self.blackKingLocation[0], self.blackKingLocation[1])
     
+    # Is (r, c) attacked by the side not to move
     def sqUnderAttack(self, r, c):
-        self.whiteToMove = not self.whiteToMove
-        oppMoves = self.getAllPossibleMoves(includingCastling = False) # Disable castling during attack
-        self.whiteToMove = not self.whiteToMove
-
-        for move in oppMoves:
-            if move.endRow == r and move.endCol == c:
-                return True
+        enemy = 'b' if self.whiteToMove else 'w'
+        return self.isAttacked(r * 8 + c, enemy, self.occupied)
+
+    # Look outward from square sq for attackers of colour, stopping at the first one found
+    def isAttacked(self, sq, colour, occupied):
+        bitboards = self.bitboards
+        if KNIGHT_ATTACKS[sq] & bitboards[colour + 'N']:
+            return True
+        if PAWN_ATTACKS['b' if colour == 'w' else 'w'][sq] & bitboards[colour + 'P']:
+            return True
+        if KING_ATTACKS[sq] & bitboards[colour + 'K']:
+            return True
+        # Only walk the rays when a slider is lined up on the empty board
+        straight = bitboards[colour + 'R'] | bitboards[colour + 'Q']
+        if ROOK_RAYS[sq] & straight and rookAttacks(sq, occupied) & straight:
+            return True
+        diagonal = bitboards[colour + 'B'] | bitboards[colour + 'Q']
+        if BISHOP_RAYS[sq] & diagonal and bishopAttacks(sq, occupied) & diagonal:
+            return True
         return False
 
-
-    def getAllPossibleMoves(self, includingCastling = True):
-        res = []
-        
-        for i in range(len(self.board)):
-            for j in range(len(self.board)):
-                player = self.board[i][j][0]
-                if (player == 'w' and self.whiteToMove) or (player == 'b' and not self.whiteToMove):
-                    piece = self.board[i][j][1]
-                    if piece == 'P':
-                        self.getPawnMove(i, j, res)
-                    elif piece == 'R':
-                        self.getRookMove(i, j, res)
-                    elif piece == 'N':
-                        self.getKnightMove(i, j, res)
-                    elif piece == 'B':
-                        self.getBishopMove(i, j, res)
-                    elif piece == 'Q':
-                        self.getQueenMove(i, j, res)
-                    elif piece == 'K':
-                        self.getKingMove(i, j, res, includingCastling)
-                    else:
-                        print('Wrong')
-        return res
-    
-    def getPawnMove(self, r, c, moves):
-        if self.whiteToMove:
-            if self.board[r - 1][c] == '--':
-                moves.append(Move((r, c), (r - 1, c), self.board))
-                if r == 6 and self.board[r - 2][c] == '--': # 2 square pawn first move
-                    moves.append(Move((r, c), (r - 2, c), self.board ))
-            
-            if c - 1 >= 0: # captures left
-                if self.board[r - 1][c - 1][0] == 'b': # Enemy's piece black
-                    moves.append(Move((r, c), (r - 1, c - 1), self.board))
-                    # En passant
-                elif (r - 1, c - 1) == self.enpassantPossbile:
-                    moves.append(Move((r, c), (r - 1, c - 1), self.board, self.enpassantPossbile ))
-            
-            if c + 1 <= 7 : # captures right
-                if self.board[r - 1][c + 1][0] == 'b':
-                    moves.append(Move((r, c), (r - 1, c + 1), self.board))
-                    # En passant
-                elif (r - 1, c + 1) == self.enpassantPossbile:
-                    moves.append(Move((r, c), (r - 1, c + 1), self.board, self.enpassantPossbile ))
-
-        else: # Black's pawn moves:
-            if self.board[r + 1][c] == '--':
-                moves.append(Move((r, c), (r + 1, c), self.board))
-                if r == 1 and self.board[r + 2][c] == '--': # 2 square pawn first move
-                    moves.append(Move((r, c), (r + 2, c), self.board ))
-            
-            if c - 1 >= 0:
-                if self.board[r + 1][c - 1][0] == 'w': # Enemy's piece black
-                    moves.append(Move((r, c), (r + 1, c - 1), self.board))
-                # En passant
-                elif (r + 1, c - 1) == self.enpassantPossbile:
-                    moves.append(Move((r, c), (r + 1, c - 1), self.board, self.enpassantPossbile ))
-
-            if c + 1 <= 7 :
-                if self.board[r + 1][c + 1][0] == 'w':
-                    moves.append(Move((r, c), (r + 1, c + 1), self.board))
-                # En passant
-                elif (r + 1, c + 1) == self.enpassantPossbile:
-                    moves.append(Move((r, c), (r + 1, c + 1), self.board, self.enpassantPossbile ))
-
-
-    def getRookMove(self, r, c, moves):
-        enemy = ''
-        if self.whiteToMove:
-            enemy = 'b'
-        else:
-            enemy = 'w'
-        
-        directions = [(0, 1), (0, -1), (1, 0), (-1, 0)]
-        for d in directions:
-            for i in range(1, 8):
-                endRow = r + d[0] * i
-                endCol = c + d[1] * i
-                if 0 <= endRow < 8 and 0 <= endCol < 8: # valid on board
-                    sq = self.board[endRow][endCol]
-                    if sq == '--': # empty
-                        moves.append(Move((r, c), (endRow, endCol), self.board))
-                    elif sq[0] == enemy:
-                        moves.append(Move((r, c), (endRow, endCol), self.board))
-                        break
-                    else:
-                        break
-                else: # Off board
-                    break
-
-    def getKnightMove(self, r, c, moves):
-        directions = [(-2, 1), (-2, -1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1)]
-        alley = 'w' if self.whiteToMove else 'b'
-        for move in directions:
-            endRow = r + move[0]
-            endCol = c + move[1]
-            if 0 <= endRow < 8 and 0 <= endCol < 8:
-                sq = self.board[endRow][endCol]
-                if sq[0] != alley:
-                    moves.append(Move((r, c), (endRow, endCol), self.board))
-
-
-
-
-    def getBishopMove(self, r, c, moves):
-        directions = [(-1, -1), (-1, 1), (1, 1,), (1, -1)]
+    # Locations of every piece of the side not to move attacking (r, c), the count is the length
+    def getAttackers(self, r, c):
         enemy = 'b' if self.whiteToMove else 'w'
-
-        for move in directions:
-            for i in range(1, 8):
-                endRow = r + move[0] * i
-                endCol = c + move[1] * i
-                if 0 <= endRow < 8 and 0 <= endCol < 8:
-                    sq = self.board[endRow][endCol]
-                    if sq == '--':
-                        moves.append(Move((r, c), (endRow, endCol), self.board))
-                    elif sq[0] == enemy:
-                        moves.append(Move((r, c), (endRow, endCol), self.board))
-                        break
-                    else:
-                        break
-                else:
+        return [(sq >> 3, sq & 7) for sq in squares(self.attackersTo(r * 8 + c, enemy, self.occupied))]
+
+
+    # Static exchange evaluation: material the side to move wins (negative: loses) on the destination
+    # square if both sides keep recapturing with their least valuable attacker and may stop at any time
+    # pieceValues maps piece letters to values, the king has to be worth more than everything else together
+    def staticExchange(self, move, pieceValues = SEE_VALUES):
+        code = move if move.__class__ is int else move.code
+        start, target = code & 63, code >> TO_SHIFT & 63
+        pieceMoved = PIECE_CODES[code >> MOVED_SHIFT & 15]
+        pieceCaptured = PIECE_CODES[code >> CAPTURED_SHIFT & 15]
+        occupied = self.occupied ^ (1 << start)
+        if code & ENPASSANT_FLAG:
+            occupied ^= 1 << ((start & ~7) | (target & 7))
+
+        # gain[d]: what the side capturing at depth d has won if the exchange stops right after it
+        gain = [pieceValues[pieceCaptured[1]] if pieceCaptured != '--' else 0]
+        onSquare = pieceMoved[1]
+        if code & PROMOTION_MASK:
+            onSquare = Move.promotionPieces[(code >> PROMOTION_SHIFT & 7) - 1]
+            gain[0] += pieceValues[onSquare] - pieceValues['P']
+
+        side = 'b' if pieceMoved[0] == 'w' else 'w'
+        attackers = (self.attackersTo(target, 'w', occupied) | self.attackersTo(target, 'b', occupied)) & occupied
+        while True:
+            # Least valuable piece of side still attacking the square
+            mine = attackers & self.colourBoards[side]
+            if not mine:
+                break
+            for piece in "PNBRQK":
+                bb = mine & self.bitboards[side + piece]
+                if bb:
                     break
+            gain.append(pieceValues[onSquare] - gain[-1])
+            if max(-gain[-2], gain[-1]) < 0: # This capture can not change the sign of the result
+                gain.pop()
+                break
+            occupied ^= bb & -bb
+            # Taking a piece off the square's lines may uncover sliders behind it
+            attackers = (self.attackersTo(target, 'w', occupied) | self.attackersTo(target, 'b', occupied)) & occupied
+            onSquare = piece
+            side = 'b' if side == 'w' else 'w'
+
+        for d in range(len(gain) - 1, 0, -1):
+            gain[d - 1] = -max(-gain[d - 1], gain[d])
+        return gain[0]
+
+    # Add a move from (r, c) to every square set in the targets bitboard
+    def addMoves(self, r, c, targets, moves):
+        mailbox = self.mailbox
+        base = r * 8 + c | MOVED_BITS[mailbox[r][c]]
+        for sq in squares(targets):
+            moves.append(base | sq << TO_SHIFT | CAPTURED_BITS[mailbox[sq >> 3][sq & 7]])
+
+    # Same for a pawn, reaching the last rank gives one move per promotion piece
+    def addPawnMoves(self, r, c, targets, moves):
+        mailbox = self.mailbox
+        base = r * 8 + c | MOVED_BITS[mailbox[r][c]]
+        for sq in squares(targets):
+            code = base | sq << TO_SHIFT | CAPTURED_BITS[mailbox[sq >> 3][sq & 7]]
+            if sq < 8 or sq >= 56:
+                for promotion in range(1, len(Move.promotionPieces) + 1):
+                    moves.append(code | promotion << PROMOTION_SHIFT)
+            else:
+                moves.append(code)
 
-    def getQueenMove(self, r, c, moves):
-        self.getBishopMove(r, c, moves)
-        self.getRookMove(r, c, moves)
-
-    def getKingMove(self, r, c, moves, includingCastling = True):
-        directions = [(-1, -1), (-1, 0), (-1, 1), (0, 1), (1, 1), (1, 0), (1, -1), (0, -1)]
-        alley = 'w' if self.whiteToMove else 'b'
-
-        for move in directions:
-            endRow = r + move[0]
-            endCol = c + move[1]
-            if 0 <= endRow < 8 and 0 <= endCol < 8:
-                sq = self.board[endRow][endCol]
-                if sq[0] != alley:
-                    moves.append(Move((r, c), (endRow, endCol), self.board))
-        
-        # Only generate castling in normal move givin:
-        if includingCastling:
-            self.getCastlingMoves(r, c, moves)
-
-
-    # Get all valid castling moves for king at pos (r, c)
-    def getCastlingMoves(self, r, c, moves):
-
-        if not moves:
-            return
-        
-        if self.sqUnderAttack(r, c):
-            return
-
-        if (self.whiteToMove and self.currentCastlingRight.wks) or (not self.whiteToMove and self.currentCastlingRight.bks):
-            self.getKingSideCastlingMove(r, c, moves)
-        
-        if (self.whiteToMove and self.currentCastlingRight.wqs) or (not self.whiteToMove and self.currentCastlingRight.bqs):
-            self.getQueenSideCastlingMove(r, c, moves)
-
-    def getKingSideCastlingMove(self, r, c, moves):
-        if self.board[r][c + 1] == '--' and self.board[r][c + 2] == '--':
-            if not self.sqUnderAttack(r, c + 1) and not self.sqUnderAttack(r, c + 2):
-                moves.append(Move((r, c), (r, c + 2), self.board, isCastlingMove = True))
-    
-    def getQueenSideCastlingMove(self, r, c, moves):
-        if self.board[r][c - 1] == '--' and self.board[r][c - 2] == '--' and self.board[r][c - 3] == "--":
-            if not self.sqUnderAttack(r, c - 1) and not self.sqUnderAttack(r, c - 2) and not self.sqUnderAttack(r, c - 3):
-                moves.append(Move((r, c), (r, c - 2), self.board, isCastlingMove = True))
-
+    # En passant capture from sq to the empty epSq, the captured pawn sits beside the mover
+    def enpassantCode(self, sq, epSq, ally):
+        enemy = 'b' if ally == 'w' else 'w'
+        return sq | epSq << TO_SHIFT | MOVED_BITS[ally + 'P'] | CAPTURED_BITS[enemy + 'P'] | ENPASSANT_FLAG
@@ -6,6 +6,8 @@ Responsibilities:
 """ 
 
 import os
+import copy
+import threading
 import pygame as p
 from ChessGame import ChessEngine, ChessAI
 
@@ -15,6 +17,13 @@ dimension = 8
 sq_size = height_image // dimension # 512 // 8
 max_fps = 15
 images = {}
+fonts = {} # SysFont per size, building one is slow
+textSurfaces = {} # Rendered texts by (text, size, colour)
+highlightSurfaces = {} # Transparent square per highlight colour
+boardSurface = None # Squares of the empty board, drawn once by loadBoard
+ai_time_limit = None # Seconds the AI may think for, None searches to ChessAI.DEPTH
+opening_book = None # Path of a Polyglot .bin opening book the AI plays from, None for no book
+tablebase_dir = None # Directory of generated endgame tables (python -m ChessGame.Tablebase), None for none
 
 
 # Initialize a global dictionary of images
@@ -29,6 +38,36 @@ def loadImages():
         path = os.path.join(images_dir, piece + ".png")
         images[piece] = p.transform.scale(p.image.load(path), (sq_size, sq_size))
 
+# Draw the empty board once, every later frame copies squares out of it
+def loadBoard():
+    global boardSurface
+    boardSurface = p.Surface((width_image, height_image))
+    drawBoard(boardSurface)
+
+'''
+AI search running in a background thread so the window keeps drawing and handling events.
+It works on a copy of the game, the main loop polls done() and plays the move itself.
+'''
+class AIThinking():
+    def __init__(self, gamestate, validMoves):
+        self.stop = threading.Event()
+        self.move = None
+        self.started = p.time.get_ticks()
+        self.thread = threading.Thread(target = self.search, args = (copy.deepcopy(gamestate), validMoves), daemon = True)
+        self.thread.start()
+
+    def search(self, gamestate, validMoves):
+        self.move = ChessAI.bookMove(gamestate)
+        if self.move is None:
+            self.move = ChessAI.findBestMoveNegamax(gamestate, validMoves, timeLimit = ai_time_limit, stop = self.stop).bestMove
+
+    def done(self):
+        return not self.thread.is_alive()
+
+    # The search stops within a few hundred nodes, its move is thrown away
+    def cancel(self):
+        self.stop.set()
+
 '''
 The Main Driver of the code.
 This will handling user's input and update the graphics
@@ -38,14 +77,21 @@ def main():
     p.init()
 
     screen = p.display.set_mode((width_image, height_image))
-    screen.fill(p.Color("white"))
+    p.event.set_blocked(p.MOUSEMOTION) # Moving the mouse changes nothing, it should not wake the loop
 
     clock = p.time.Clock()
+    if opening_book:
+        ChessAI.useOpeningBook(opening_book)
+    if tablebase_dir:
+        ChessAI.useTablebase(tablebase_dir)
     gamestate = ChessEngine.GameState()
     validMoves = gamestate.getValidateMoves()
     moveMade = False
     animate = False
     loadImages()
+    loadBoard()
+    renderer = BoardRenderer(screen)
+    renderer.draw(gamestate, validMoves, (), [])
     squareSelected = () # Init no square first, last click of user's input (tuple(row, rol))
     playerClicks = [] # player click's two tuples : eg[(6, 4), (4, 4)]
     # Checking game over
@@ -55,14 +101,28 @@ def main():
 
     playerOne = True # If human -> True, AI plays -> False
     playerTwo = False # If human black -> True, AI plays black -> False
+    aiThinking = None # Background AI search, only while it is the AI's turn
 
     while running:
         isHumanTurn = (gamestate.whiteToMove and playerOne) or (not gamestate.whiteToMove and playerTwo)
 
+        # Nothing changes on its own while the human is to move (or the game is over): sleep until an event
+        # While the AI thinks the loop keeps ticking to poll it and animate the thinking note
+        if aiThinking is None and (isHumanTurn or gameOver):
+            events = [p.event.wait()] + p.event.get()
+        else:
+            clock.tick(max_fps)
+            events = p.event.get()
 
-        for e in p.event.get():
+        for e in events:
             if e.type == p.QUIT:
                 running = False
+                if aiThinking:
+                    aiThinking.cancel()
+
+            # Window uncovered or restored, what was on screen is gone
+            elif e.type in REDRAW_EVENTS:
+                renderer.invalidate()
             
             # Mouse handling
             elif e.type == p.MOUSEBUTTONDOWN:
@@ -96,6 +156,9 @@ def main():
             elif e.type == p.KEYDOWN:
                 # Undo key : z
                 if e.key == p.K_z: # Undo key
+                    if aiThinking:
+                        aiThinking.cancel()
+                        aiThinking = None
                     gamestate.undoMove()
                     moveMade = True
                     animate = False
@@ -103,6 +166,9 @@ def main():
                 
                 # Reset key : r
                 if e.key == p.K_r:
+                    if aiThinking:
+                        aiThinking.cancel()
+                        aiThinking = None
                     gamestate = ChessEngine.GameState()
                     validMoves = gamestate.getValidateMoves()
                     squareSelected = ()
@@ -111,55 +177,128 @@ def main():
                     animate = False
                     gameOver = False
 
-        # Finder move AI
-        if not gameOver and not isHumanTurn:
-            # Finding the best move at the current board state
-            AIMove = ChessAI.findBestMoveMinMax(gamestate, validMoves)
-            
-            if AIMove is None:
-                AIMove = ChessAI.randomMove(validMoves)
-
-            gamestate.makeMoves(AIMove)
-            moveMade = True
-            animate = True
+        # Finder move AI, started in the background and played once it is done
+        isHumanTurn = (gamestate.whiteToMove and playerOne) or (not gamestate.whiteToMove and playerTwo)
+        if running and not gameOver and not isHumanTurn and not moveMade:
+            if aiThinking is None:
+                aiThinking = AIThinking(gamestate, validMoves)
+            elif aiThinking.done():
+                AIMove = aiThinking.move
+                aiThinking = None
+                if AIMove is None:
+                    AIMove = ChessAI.randomMove(validMoves)
+
+                gamestate.makeMoves(AIMove)
+                moveMade = True
+                animate = True
 
             
         if moveMade == True:
             if animate:
-                animatemove(gamestate.moveLogs[-1], screen, gamestate.board, clock)
+                renderer.animate(ChessEngine.Move.fromCode(gamestate.moveLogs[-1]), gamestate.board, clock)
             validMoves = gamestate.getValidateMoves()
             moveMade = False
             animate = False
-            
-        
-        drawGameState(screen, gamestate, validMoves, squareSelected)
 
+        overlays = []
         if gamestate.checkMate:
             gameOver = True
             if gamestate.whiteToMove:
-                drawText(screen, "Black wins")
+                overlays.append(textOverlay("Black wins"))
             else:
-                drawText(screen, "White wins")
+                overlays.append(textOverlay("White wins"))
             
         elif gamestate.staleMate:
             gameOver = True
-            drawText(screen, "Stalemate!")
-        clock.tick(max_fps)
-        p.display.flip()
+            overlays.append(textOverlay("Stalemate!"))
+        elif gamestate.isRepetition(2) or gamestate.isFiftyMoveDraw():
+            gameOver = True
+            overlays.append(textOverlay("Draw!"))
+        if aiThinking:
+            overlays.append(thinkingOverlay(aiThinking))
+
+        if running:
+            renderer.draw(gamestate, validMoves, squareSelected, overlays)
 
 '''
 All the graphics within the game state
 '''
 
-def drawGameState(screen, gamestate, validMoves, sqSelected):
-    # Draw the sq on the board
-    drawBoard(screen) 
-
-    # Highlighting the moves and sq before draw the piece
-    highlightingsq(screen, gamestate, validMoves, sqSelected)
+# Events after which the whole window has to be drawn again
+REDRAW_EVENTS = {p.VIDEOEXPOSE, getattr(p, "WINDOWEXPOSED", p.VIDEOEXPOSE), getattr(p, "WINDOWRESTORED", p.VIDEOEXPOSE)}
 
-    # Draw Pieces on top
-    drawPieces(screen, gamestate.board) 
+'''
+Keeps what each square showed last frame and only draws and updates the squares that changed.
+Overlays (text over the board) are (key, surface, rect), the squares under them are redrawn when they change.
+'''
+class BoardRenderer():
+    def __init__(self, screen):
+        self.screen = screen
+        self.shown = {} # (row, col) -> (piece, highlight colour) currently on screen
+        self.overlays = [] # Overlays currently on screen
+
+    # Forget what is on screen, the next draw repaints everything
+    def invalidate(self):
+        self.shown = {}
+        self.overlays = []
+
+    def draw(self, gamestate, validMoves, sqSelected, overlays):
+        highlights = highlightingsq(gamestate, validMoves, sqSelected)
+        board = gamestate.board
+        dirty = set()
+        for row in range(dimension):
+            for col in range(dimension):
+                wanted = (board[row][col], highlights.get((row, col)))
+                if self.shown.get((row, col)) != wanted:
+                    self.shown[(row, col)] = wanted
+                    dirty.add((row, col))
+
+        # Overlays that appeared, changed or went away take the squares under them along
+        if [overlay[0] for overlay in overlays] != [overlay[0] for overlay in self.overlays]:
+            for key, surface, rect in self.overlays + overlays:
+                dirty |= squaresUnder(rect)
+        if not dirty:
+            return
+
+        rects = [drawSquare(self.screen, row, col, *self.shown[(row, col)]) for row, col in dirty]
+        for key, surface, rect in overlays:
+            if rect.collidelist(rects) != -1:
+                self.screen.blit(surface, rect)
+        self.overlays = overlays
+        p.display.update(rects)
+
+    # Slide the piece of the move (already made on board) from its start to its end square
+    # Each frame only the few squares under the piece before and after it moved are drawn again
+    def animate(self, move, board, clock):
+        dR = move.endRow - move.startRow
+        dC = move.endCol - move.startCol
+
+        # Frame to move one sq
+        frames = 5
+        frameCount = (abs(dR) + abs(dC)) * (frames)
+
+        # The end square shows what was captured there until the piece arrives
+        captured = move.pieceCaptured if move.pieceCaptured != '--' and not move.isEnpassantMove else "--"
+        self.shown[(move.endRow, move.endCol)] = (captured, None)
+        self.shown[(move.startRow, move.startCol)] = ("--", None)
+        pieceRect = None
+        for frame in range(frameCount + 1):
+            r, c = ((move.startRow + dR * frame / frameCount, move.startCol + dC * frame / frameCount))
+            newRect = p.Rect(c * sq_size, r * sq_size, sq_size, sq_size)
+            under = squaresUnder(newRect) | (squaresUnder(pieceRect) if pieceRect else {(move.startRow, move.startCol)})
+            rects = [drawSquare(self.screen, row, col, *self.shown.get((row, col), (board[row][col], None)))
+                     for row, col in under]
+
+            # Drawing the moving piece
+            self.screen.blit(images[move.pieceMoved], newRect)
+            p.display.update(rects)
+            pieceRect = newRect
+
+            clock.tick(60)
+
+        # Squares the animation drew over are brought up to date by the next draw
+        for square in squaresUnder(pieceRect) | {(move.startRow, move.startCol), (move.endRow, move.endCol)}:
+            self.shown.pop(square, None)
 
 
 '''
@@ -175,102 +314,82 @@ def drawBoard(screen):
             colour = colours[((i + j) % 2)]
             p.draw.rect(screen, colour, p.Rect(j * sq_size, i * sq_size, sq_size, sq_size))
 
-def drawPieces(screen, board):
-    
-    # m * n time complexity 
-    for row in range(dimension):
-        for col in range(dimension):
-            piece = board[row][col]
-            if piece != "--":
-                screen.blit(images[piece], p.Rect(col * sq_size, row * sq_size, sq_size, sq_size)) 
+# One square: the board under it, its highlight and its piece. Returns the square's rect
+def drawSquare(screen, row, col, piece, highlight):
+    rect = p.Rect(col * sq_size, row * sq_size, sq_size, sq_size)
+    screen.blit(boardSurface, rect, rect)
+    if highlight is not None:
+        screen.blit(highlightSurface(highlight), rect)
+    if piece != "--":
+        screen.blit(images[piece], rect)
+    return rect
+
+# Squares (row, col) a rect on the screen overlaps
+def squaresUnder(rect):
+    rect = rect.clip(p.Rect(0, 0, width_image, height_image))
+    return {(row, col) for row in range(rect.top // sq_size, (rect.bottom - 1) // sq_size + 1)
+                       for col in range(rect.left // sq_size, (rect.right - 1) // sq_size + 1)} if rect.width and rect.height else set()
 
 
-# Highlighting square
-def highlightingsq(screen, gamestate, validMoves, sqSelected):
+# Highlighting square: the selected piece in blue and where it can go in yellow, as {(row, col): colour}
+def highlightingsq(gamestate, validMoves, sqSelected):
+    highlights = {}
 
     # Make sure sq is not empty
     if sqSelected:
         r, c = sqSelected
 
-
-        # Fixing this
-        who_to_move = None
-        if gamestate.whiteToMove:
-            who_to_move = "w"
-        else:
-            who_to_move = "b"
+        who_to_move = "w" if gamestate.whiteToMove else "b"
 
         # Check whethere location is check on their own square
-
         if gamestate.board[r][c][0] == who_to_move:
 
-            # Highlightin the selected sq
-            s = p.Surface((sq_size, sq_size))
-
-            # Tranparency value
-            s.set_alpha(150)
-
-            # Colour
-            s.fill(p.Color("blue"))
-
-            # Bliting the surface s to location
-            screen.blit(s, (c * sq_size, r * sq_size))
-
-            # Highting moves from the selected square
-            s.fill(p.Color("yellow"))
-
             # Getting all valid moves
             for move in validMoves:
                 if move.startRow == r and move.startCol == c:
-                    screen.blit(s, (sq_size * move.endCol, sq_size * move.endRow))
-
-
-# Animating move
-def animatemove(move, screen, board, clock):
-    global colours
-
-    dR = move.endRow - move.startRow
-    dC = move.endCol - move.startCol
-
-    # Frame to move one sq
-    frames = 5
-    frameCount = (abs(dR) + abs(dC)) * (frames)
-
-    for frame in range(frameCount + 1):
-        r, c = ((move.startRow + dR * frame / frameCount, move.startCol + dC * frame / frameCount))
-        drawBoard(screen)
-        drawPieces(screen, board)
-
-        # Erase move from ending sq
-        color = colours[(move.endRow + move.endCol) % 2]
-        endSq = p.Rect(move.endCol * sq_size, move.endRow * sq_size, sq_size, sq_size)
-        p.draw.rect(screen, color, endSq)
-
-        # Draw captured piece onto
-        if move.pieceCaptured != '--':
-            # print("Checking")
-            screen.blit(images[move.pieceCaptured], endSq)
-
-        # Drawing the moving piece
-        screen.blit(images[move.pieceMoved], p.Rect(c * sq_size, r * sq_size, sq_size, sq_size))
-        p.display.flip()
-
-        clock.tick(60)
-
-
-# Draw Text
-def drawText(screen, text):
-    # Getting arial font
-    font = p.font.SysFont("arial", 32, True, False)
+                    highlights[(move.endRow, move.endCol)] = "yellow"
 
+            # Highlightin the selected sq
+            highlights[(r, c)] = "blue"
+    return highlights
+
+# Tranparent square of a highlight colour, made once per colour
+def highlightSurface(colour):
+    if colour not in highlightSurfaces:
+        s = p.Surface((sq_size, sq_size))
+        s.set_alpha(150)
+        s.fill(p.Color(colour))
+        highlightSurfaces[colour] = s
+    return highlightSurfaces[colour]
+
+
+# Arial bold of a size, fonts are cached because SysFont looks through the installed fonts every time
+def getFont(size):
+    if size not in fonts:
+        fonts[size] = p.font.SysFont("arial", size, True, False)
+    return fonts[size]
+
+# Rendered text, kept around as there are only a handful of different ones
+def renderText(text, size, colour):
+    key = (text, size, colour)
+    if key not in textSurfaces:
+        textSurfaces[key] = getFont(size).render(text, 0, p.Color(colour))
+    return textSurfaces[key]
+
+# Game over text in the middle of the board
+def textOverlay(text):
     # Text object rendering giving text
-    textObject = font.render(text, 0, p.Color('Black'))
+    textObject = renderText(text, 32, "Black")
 
     # Location for textObject
     textLocation = p.Rect(0, 0, width_image, height_image).move(width_image / 2 - textObject.get_width() / 2, height_image / 2 - textObject.get_width() / 2)
+    return ((text, 32), textObject, p.Rect(textLocation.topleft, textObject.get_size()))
 
-    screen.blit(textObject, textLocation)
+# Small "Thinking" note in the corner while the AI searches, the dots show the loop is alive
+def thinkingOverlay(aiThinking):
+    dots = "." * ((p.time.get_ticks() - aiThinking.started) // 400 % 4)
+    textObject = renderText("Thinking" + dots, 16, "Red")
+    return (("Thinking" + dots, 16), textObject, p.Rect((4, height_image - textObject.get_height() - 4), textObject.get_size()))
 
 if __name__ == "__main__":
     main()
-
@@ -0,0 +1,183 @@
+"""
+Evaluation File:
+Responsibilities:
+1. Material and piece square tables for the middlegame and the endgame (centipawns)
+2. Game phase weights used to blend (taper) the two
+3. O(1) evaluation from the totals GameState keeps up to date in putPiece / removePiece
+4. Batch evaluation of many positions at once with NumPy, for offline scoring
+"""
+
+import numpy as np
+from ChessGame.Move import PIECE_CODES, PIECE_INDEX
+from ChessGame.Bitboard import popCount
+
+# Material in the middlegame and the endgame, pawns and rooks grow in value as the board empties
+MG_VALUES = {"P": 100, "N": 320, "B": 330, "R": 500, "Q": 900, "K": 0}
+EG_VALUES = {"P": 120, "N": 300, "B": 320, "R": 520, "Q": 920, "K": 0}
+
+# Pawn unit values for static exchange (GameState.staticExchange), the scale of ChessAI.piecesScore
+# The king is worth more than everything else together, so an exchange never gives it up
+SEE_VALUES = {"P": 1, "N": 3, "B": 3, "R": 5, "Q": 8, "K": 100}
+
+# Phase: 24 with all minor and major pieces on the board, 0 with only kings and pawns
+PHASE_WEIGHTS = {"P": 0, "N": 1, "B": 1, "R": 2, "Q": 4, "K": 0}
+MAX_PHASE = 24
+
+# Tables from white's point of view, laid out like the board (row 0 is the 8th rank)
+PAWN_MG = [
+     0,   0,   0,   0,   0,   0,   0,   0,
+    50,  50,  50,  50,  50,  50,  50,  50,
+    10,  10,  20,  30,  30,  20,  10,  10,
+     5,   5,  10,  25,  25,  10,   5,   5,
+     0,   0,   0,  20,  20,   0,   0,   0,
+     5,  -5, -10,   0,   0, -10,  -5,   5,
+     5,  10,  10, -20, -20,  10,  10,   5,
+     0,   0,   0,   0,   0,   0,   0,   0,
+]
+
+PAWN_EG = [
+     0,   0,   0,   0,   0,   0,   0,   0,
+    80,  80,  80,  80,  80,  80,  80,  80,
+    50,  50,  50,  50,  50,  50,  50,  50,
+    30,  30,  30,  30,  30,  30,  30,  30,
+    15,  15,  15,  15,  15,  15,  15,  15,
+     5,   5,   5,   5,   5,   5,   5,   5,
+     0,   0,   0,   0,   0,   0,   0,   0,
+     0,   0,   0,   0,   0,   0,   0,   0,
+]
+
+KNIGHT = [
+   -50, -40, -30, -30, -30, -30, -40, -50,
+   -40, -20,   0,   0,   0,   0, -20, -40,
+   -30,   0,  10,  15,  15,  10,   0, -30,
+   -30,   5,  15,  20,  20,  15,   5, -30,
+   -30,   0,  15,  20,  20,  15,   0, -30,
+   -30,   5,  10,  15,  15,  10,   5, -30,
+   -40, -20,   0,   5,   5,   0, -20, -40,
+   -50, -40, -30, -30, -30, -30, -40, -50,
+]
+
+BISHOP = [
+   -20, -10, -10, -10, -10, -10, -10, -20,
+   -10,   0,   0,   0,   0,   0,   0, -10,
+   -10,   0,   5,  10,  10,   5,   0, -10,
+   -10,   5,   5,  10,  10,   5,   5, -10,
+   -10,   0,  10,  10,  10,  10,   0, -10,
+   -10,  10,  10,  10,  10,  10,  10, -10,
+   -10,   5,   0,   0,   0,   0,   5, -10,
+   -20, -10, -10, -10, -10, -10, -10, -20,
+]
+
+ROOK = [
+     0,   0,   0,   0,   0,   0,   0,   0,
+     5,  10,  10,  10,  10,  10,  10,   5,
+    -5,   0,   0,   0,   0,   0,   0,  -5,
+    -5,   0,   0,   0,   0,   0,   0,  -5,
+    -5,   0,   0,   0,   0,   0,   0,  -5,
+    -5,   0,   0,   0,   0,   0,   0,  -5,
+    -5,   0,   0,   0,   0,   0,   0,  -5,
+     0,   0,   0,   5,   5,   0,   0,   0,
+]
+
+QUEEN = [
+   -20, -10, -10,  -5,  -5, -10, -10, -20,
+   -10,   0,   0,   0,   0,   0,   0, -10,
+   -10,   0,   5,   5,   5,   5,   0, -10,
+    -5,   0,   5,   5,   5,   5,   0,  -5,
+     0,   0,   5,   5,   5,   5,   0,  -5,
+   -10,   5,   5,   5,   5,   5,   0, -10,
+   -10,   0,   5,   0,   0,   0,   0, -10,
+   -20, -10, -10,  -5,  -5, -10, -10, -20,
+]
+
+# Stay tucked away behind the pawns while there is material, walk to the centre in the endgame
+KING_MG = [
+   -30, -40, -40, -50, -50, -40, -40, -30,
+   -30, -40, -40, -50, -50, -40, -40, -30,
+   -30, -40, -40, -50, -50, -40, -40, -30,
+   -30, -40, -40, -50, -50, -40, -40, -30,
+   -20, -30, -30, -40, -40, -30, -30, -20,
+   -10, -20, -20, -20, -20, -20, -20, -10,
+    20,  20,   0,   0,   0,   0,  20,  20,
+    20,  30,  10,   0,   0,  10,  30,  20,
+]
+
+KING_EG = [
+   -50, -40, -30, -20, -20, -30, -40, -50,
+   -30, -20, -10,   0,   0, -10, -20, -30,
+   -30, -10,  20,  30,  30,  20, -10, -30,
+   -30, -10,  30,  40,  40,  30, -10, -30,
+   -30, -10,  30,  40,  40,  30, -10, -30,
+   -30, -10,  20,  30,  30,  20, -10, -30,
+   -30, -30,   0,   0,   0,   0, -30, -30,
+   -50, -30, -30, -30, -30, -30, -30, -50,
+]
+
+_MG_TABLES = {"P": PAWN_MG, "N": KNIGHT, "B": BISHOP, "R": ROOK, "Q": QUEEN, "K": KING_MG}
+_EG_TABLES = {"P": PAWN_EG, "N": KNIGHT, "B": BISHOP, "R": ROOK, "Q": QUEEN, "K": KING_EG}
+
+
+# Signed material + square score for every piece on every square, positive is good for white
+# Black reads the white table upside down (sq ^ 56 flips the row)
+def _signedTables(values, tables):
+    signed = {}
+    for piece, table in tables.items():
+        signed["w" + piece] = [values[piece] + table[sq] for sq in range(64)]
+        signed["b" + piece] = [-(values[piece] + table[sq ^ 56]) for sq in range(64)]
+    return signed
+
+
+PST_MG = _signedTables(MG_VALUES, _MG_TABLES)
+PST_EG = _signedTables(EG_VALUES, _EG_TABLES)
+PHASE = {colour + piece: weight for piece, weight in PHASE_WEIGHTS.items() for colour in "wb"}
+
+
+# Blend the middlegame and endgame scores by how much material is left
+def taper(mgScore, egScore, phase):
+    phase = min(phase, MAX_PHASE) # Promotions can push it past the starting material
+    return (mgScore * phase + egScore * (MAX_PHASE - phase)) // MAX_PHASE
+
+
+# Score of the position in centipawns, positive is good for white
+def evaluate(gamestate):
+    return taper(gamestate.mgScore, gamestate.egScore, gamestate.phase)
+
+
+# Material only, no piece squares: a plain baseline to measure the tables against
+def evaluateMaterial(gamestate):
+    bitboards = gamestate.bitboards
+    return sum(MG_VALUES[piece] * (popCount(bitboards["w" + piece]) - popCount(bitboards["b" + piece])) for piece in "PNBRQ")
+
+
+# Evaluation functions by name, for picking one in configurations (see Match)
+EVALUATIONS = {"pst": evaluate, "material": evaluateMaterial}
+
+
+# Batch evaluation: a position is 64 int8 piece codes (index in Move.PIECE_CODES, 0 for an empty square)
+# laid out like the board, square = row * 8 + col. Rows of these tables are indexed by that code
+PST_MG_TABLE = np.array([[0] * 64] + [PST_MG[piece] for piece in PIECE_CODES[1:]], dtype = np.int64)
+PST_EG_TABLE = np.array([[0] * 64] + [PST_EG[piece] for piece in PIECE_CODES[1:]], dtype = np.int64)
+PHASE_TABLE = np.array([0] + [PHASE[piece] for piece in PIECE_CODES[1:]], dtype = np.int64)
+SQUARES = np.arange(64)
+
+
+# GameState board as a (64,) int8 array of piece codes
+def encodeBoard(gamestate):
+    return np.array([PIECE_INDEX[piece] for row in gamestate.mailbox for piece in row], dtype = np.int8)
+
+
+# A stack of GameStates as an (N, 64) int8 array
+def encodeBoards(gamestates):
+    return np.array([encodeBoard(gamestate) for gamestate in gamestates], dtype = np.int8).reshape(-1, 64)
+
+
+# Scores in centipawns (positive is good for white) for every position, same numbers as evaluate
+# positions: (N, 64) int8 array of piece codes, or any sequence of GameStates
+def evaluateBatch(positions):
+    if not isinstance(positions, np.ndarray):
+        positions = encodeBoards(positions)
+    positions = positions.reshape(-1, 64)
+    mgScore = PST_MG_TABLE[positions, SQUARES].sum(axis = 1)
+    egScore = PST_EG_TABLE[positions, SQUARES].sum(axis = 1)
+    phase = np.minimum(PHASE_TABLE[positions].sum(axis = 1), MAX_PHASE)
+    return (mgScore * phase + egScore * (MAX_PHASE - phase)) // MAX_PHASE
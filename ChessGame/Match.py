@@ -0,0 +1,230 @@
+"""
+Match File:
+Responsibilities:
+1. Engine against engine games without the GUI, two configurations played over a process pool
+2. Streaming every finished game to a PGN file as soon as it completes
+3. A running score and Elo estimate with a 95% error margin
+
+Usage:
+    python -m ChessGame.Match --games 200 --workers 8 --first depth=3 --second depth=2,eval=material --pgn match.pgn
+"""
+
+import argparse
+import math
+import multiprocessing
+import random
+import sys
+import time
+
+from ChessGame.ChessEngine import GameState
+from ChessGame.MoveOrdering import MoveOrderer
+from ChessGame.TranspositionTable import TranspositionTable
+from ChessGame.Evaluation import EVALUATIONS
+from ChessGame.Bitboard import popCount
+from ChessGame.PGN import toSan, formatGame
+from ChessGame import ChessAI
+
+# Short balanced openings (coordinate notation), each is played twice with the colours swapped
+OPENINGS = [
+    "e2e4 e7e5 g1f3 b8c6",
+    "e2e4 c7c5 g1f3 d7d6",
+    "e2e4 e7e6 d2d4 d7d5",
+    "e2e4 c7c6 d2d4 d7d5",
+    "d2d4 d7d5 c2c4 e7e6",
+    "d2d4 g8f6 c2c4 g7g6",
+    "d2d4 g8f6 c2c4 e7e6",
+    "c2c4 e7e5 b1c3 g8f6",
+    "g1f3 d7d5 g2g3 g8f6",
+    "e2e4 e7e5 g1f3 b8c6 f1b5 a7a6",
+]
+
+MAX_PLIES = 400 # Games still going after this many plies are called a draw
+TABLE_MB = 1 # Transposition table of each engine in a game
+
+
+# One side of the match: search limits and evaluation
+class EngineConfig():
+    def __init__(self, name, depth = None, timeLimit = None, nodeLimit = None, evaluation = "pst"):
+        if evaluation not in EVALUATIONS:
+            raise ValueError("Unknown evaluation " + evaluation + ", pick one of " + ", ".join(EVALUATIONS))
+        self.name = name
+        self.depth = depth if depth is not None else (ChessAI.DEPTH if timeLimit is None and nodeLimit is None else ChessAI.MAX_DEPTH)
+        self.timeLimit = timeLimit
+        self.nodeLimit = nodeLimit
+        self.evaluation = evaluation
+
+    # "depth=3,time=0.5,nodes=20000,eval=material,name=x" style description
+    @classmethod
+    def parse(cls, text, name):
+        fields = dict(field.split("=", 1) for field in text.split(",") if field)
+        return cls(fields.get("name", name),
+                   int(fields["depth"]) if "depth" in fields else None,
+                   float(fields["time"]) if "time" in fields else None,
+                   int(fields["nodes"]) if "nodes" in fields else None,
+                   fields.get("eval", "pst"))
+
+    def describe(self):
+        limits = ["depth %d" % self.depth]
+        if self.timeLimit is not None:
+            limits.append("%gs" % self.timeLimit)
+        if self.nodeLimit is not None:
+            limits.append("%d nodes" % self.nodeLimit)
+        return "%s (%s, %s eval)" % (self.name, ", ".join(limits), self.evaluation)
+
+
+# Result of the game so far as (result, termination), None while it goes on
+def gameOver(gamestate, moves, plies, maxPlies):
+    if not moves:
+        if gamestate.checkMate:
+            return ("0-1" if gamestate.whiteToMove else "1-0"), "checkmate"
+        return "1/2-1/2", "stalemate"
+    if gamestate.isFiftyMoveDraw():
+        return "1/2-1/2", "fifty move rule"
+    if gamestate.isRepetition(2):
+        return "1/2-1/2", "threefold repetition"
+    bitboards = gamestate.bitboards
+    heavy = bitboards["wP"] | bitboards["bP"] | bitboards["wR"] | bitboards["bR"] | bitboards["wQ"] | bitboards["bQ"]
+    if not heavy and popCount(gamestate.occupied) <= 3:
+        return "1/2-1/2", "insufficient material"
+    if plies >= maxPlies:
+        return "1/2-1/2", "adjudicated after %d plies" % maxPlies
+    return None
+
+
+# Play one game, task = (round, opening, white, black, randomPlies, seed, maxPlies). Runs in a pool worker
+def playGame(task):
+    round, opening, white, black, randomPlies, seed, maxPlies = task
+    gamestate = GameState()
+    sanMoves = []
+
+    # Opening line, then a few random moves (the same for both games of a pair) to vary the games
+    rng = random.Random(seed)
+    for ply, notation in enumerate(opening.split() + [None] * randomPlies):
+        moves = gamestate.getValidateMoves()
+        if not moves:
+            break
+        move = next(move for move in moves if move.getChessNotation() == notation) if notation else rng.choice(moves)
+        sanMoves.append(toSan(gamestate, move, moves))
+        gamestate.makeMoves(move)
+
+    state = {config: (MoveOrderer(ChessAI.piecesScore, ChessAI.MAX_PLY), TranspositionTable.fromMegabytes(TABLE_MB)) for config in (white, black)}
+    while True:
+        moves = gamestate.getValidateMoves()
+        over = gameOver(gamestate, moves, len(sanMoves), maxPlies)
+        if over is not None:
+            break
+        config = white if gamestate.whiteToMove else black
+        ordering, table = state[config]
+        search = ChessAI.Search(gamestate, config.depth, config.timeLimit, config.nodeLimit, ordering, table,
+                                evaluation = EVALUATIONS[config.evaluation])
+        move = search.run(moves).bestMove
+        sanMoves.append(toSan(gamestate, move, moves))
+        gamestate.makeMoves(move)
+
+    result, termination = over
+    return {"round": round, "white": white.name, "black": black.name, "result": result, "termination": termination,
+            "moves": sanMoves, "opening": opening}
+
+
+# Score of the first engine against the second, from its point of view
+class MatchScore():
+    def __init__(self):
+        self.wins = 0
+        self.losses = 0
+        self.draws = 0
+
+    def add(self, points):
+        if points == 1:
+            self.wins += 1
+        elif points == 0:
+            self.losses += 1
+        else:
+            self.draws += 1
+
+    @property
+    def games(self):
+        return self.wins + self.losses + self.draws
+
+    @property
+    def score(self):
+        return (self.wins + 0.5 * self.draws) / self.games if self.games else 0.5
+
+    # Elo difference and its 95% margin, from the score and the spread of the game results
+    def elo(self):
+        n, s = self.games, self.score
+        if n == 0 or s <= 0 or s >= 1:
+            return eloFromScore(s), float("inf")
+        variance = (self.wins + 0.25 * self.draws) / n - s * s
+        margin = 1.96 * math.sqrt(variance / n)
+        low, high = eloFromScore(s - margin), eloFromScore(s + margin)
+        return eloFromScore(s), (high - low) / 2
+
+    def summary(self):
+        elo, margin = self.elo()
+        return "Games %d: +%d -%d =%d  score %.1f%%  Elo %+.1f +/- %.1f" % (
+            self.games, self.wins, self.losses, self.draws, 100 * self.score, elo, margin)
+
+
+def eloFromScore(score):
+    if score <= 0:
+        return -float("inf")
+    if score >= 1:
+        return float("inf")
+    return -400 * math.log10(1 / score - 1)
+
+
+# Play games between first and second over a pool of workers, PGN games are appended to pgnPath as they finish
+# Every opening is played twice, once with each engine as white. report gets a line after every game
+def runMatch(first, second, games = 100, workers = None, pgnPath = None, openings = OPENINGS, randomPlies = 2,
+             maxPlies = MAX_PLIES, report = print):
+    tasks = []
+    for round in range(games):
+        pair = round // 2
+        white, black = (first, second) if round % 2 == 0 else (second, first)
+        tasks.append((round + 1, openings[pair % len(openings)], white, black, randomPlies, pair, maxPlies))
+
+    score = MatchScore()
+    date = time.strftime("%Y.%m.%d")
+    pgn = open(pgnPath, "w") if pgnPath else None
+    try:
+        with multiprocessing.Pool(workers) as pool:
+            for game in pool.imap_unordered(playGame, tasks):
+                if pgn is not None:
+                    headers = {"Event": "ChessGame match", "Site": "local", "Date": date, "Round": game["round"],
+                               "White": game["white"], "Black": game["black"], "Termination": game["termination"],
+                               "Opening": game["opening"]}
+                    pgn.write(formatGame(headers, game["moves"], game["result"]))
+                    pgn.flush()
+                points = {"1-0": 1, "0-1": 0}.get(game["result"], 0.5)
+                score.add(points if game["white"] == first.name else 1 - points)
+                if report is not None:
+                    report("Round %d %s: %s  |  %s" % (game["round"], game["result"], game["termination"], score.summary()))
+    finally:
+        if pgn is not None:
+            pgn.close()
+    return score
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Play two engine configurations against each other")
+    parser.add_argument("--first", default = "", help = "depth=N,time=S,nodes=N,eval=pst|material,name=X")
+    parser.add_argument("--second", default = "", help = "same fields as --first")
+    parser.add_argument("--games", type = int, default = 100)
+    parser.add_argument("--workers", type = int, default = None, help = "processes, one per core by default")
+    parser.add_argument("--pgn", help = "file the games are written to")
+    parser.add_argument("--random-plies", type = int, default = 2, help = "random moves after each opening line")
+    parser.add_argument("--max-plies", type = int, default = MAX_PLIES)
+    args = parser.parse_args(argv)
+
+    first = EngineConfig.parse(args.first, "first")
+    second = EngineConfig.parse(args.second, "second")
+    if first.name == second.name:
+        second.name += "-2"
+    print(first.describe(), "vs", second.describe())
+    score = runMatch(first, second, args.games, args.workers, args.pgn, randomPlies = args.random_plies, maxPlies = args.max_plies)
+    print(score.summary())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,4 +1,34 @@
+# A move is packed into one int, the search only ever handles these:
+#   bits  0 - 5   start square (row * 8 + col)
+#   bits  6 - 11  end square
+#   bits 12 - 14  promotion piece, 0 none, otherwise 1 + index in Move.promotionPieces
+#   bit  15       en passant
+#   bit  16       castling
+#   bits 17 - 20  piece moved, index in PIECE_CODES
+#   bits 21 - 24  piece captured, index in PIECE_CODES (0 when nothing is captured)
+PIECES = ["wP", "wN", "wB", "wR", "wQ", "wK", "bP", "bN", "bB", "bR", "bQ", "bK"]
+PIECE_CODES = ["--"] + PIECES
+PIECE_INDEX = {piece: i for i, piece in enumerate(PIECE_CODES)}
+
+TO_SHIFT = 6
+PROMOTION_SHIFT = 12
+ENPASSANT_FLAG = 1 << 15
+CASTLING_FLAG = 1 << 16
+MOVED_SHIFT = 17
+CAPTURED_SHIFT = 21
+
+PROMOTION_MASK = 7 << PROMOTION_SHIFT
+CAPTURED_MASK = 15 << CAPTURED_SHIFT
+MOVE_KEY_MASK = (1 << 15) - 1 # Start, end and promotion: what tells two moves in a position apart
+
+MOVED_BITS = {piece: i << MOVED_SHIFT for piece, i in PIECE_INDEX.items()}
+CAPTURED_BITS = {piece: i << CAPTURED_SHIFT for piece, i in PIECE_INDEX.items()}
+
+
+# Thin wrapper around a packed move for the UI and for notation, the int lives in code
 class Move():
+    __slots__ = ("code",)
+
     ranks = {
         "1" : 7,
         "2" : 6,
@@ -23,40 +53,95 @@ class Move():
     }
     colsToFiles = {v : k for k, v in filesToCols.items()}
 
-    def __init__(self, start, end, board,  enpassantPossible = (), isCastlingMove = ()):
-        self.startRow = start[0]
-        self.startCol = start[1]
-        self.endRow = end[0]
-        self.endCol = end[1]
-        self.pieceMoved = board[self.startRow][self.startCol]
-        self.pieceCaptured = board[self.endRow][self.endCol]
-        self.isPawnPromotion = False
+    # Pieces a pawn can promote to
+    promotionPieces = ["Q", "R", "B", "N"]
+
+    def __init__(self, start, end, board,  enpassantPossible = (), isCastlingMove = (), promotionPiece = "Q"):
+        startRow, startCol = start
+        endRow, endCol = end
+        pieceMoved = str(board[startRow][startCol])
+        pieceCaptured = str(board[endRow][endCol])
+        code = startRow * 8 + startCol | (endRow * 8 + endCol) << TO_SHIFT | MOVED_BITS[pieceMoved]
+
         # Pawn promotion logic
-        if (self.pieceMoved == "wP" and self.endRow == 0) or (self.pieceMoved == "bP" and self.endRow == 7):
-            self.isPawnPromotion = True
-        
+        if (pieceMoved == "wP" and endRow == 0) or (pieceMoved == "bP" and endRow == 7):
+            code |= (self.promotionPieces.index(promotionPiece) + 1) << PROMOTION_SHIFT
+
         # En passant logic
-        self.isEnpassantMove = False
-        self.prevEnpassantPossbile = enpassantPossible
+        if pieceMoved[1] == "P" and (endRow, endCol) == enpassantPossible:
+            code |= ENPASSANT_FLAG
+            pieceCaptured = 'bP' if pieceMoved[0] == 'w' else 'wP'
 
-        if self.pieceMoved[1] == "P" and (self.endRow, self.endCol) == enpassantPossible:
-            self.isEnpassantMove = True
-            self.pieceCaptured = 'bP' if self.pieceMoved[0] == 'w' else 'wP'
-        
         # Castling move lgic
-        self.isCastlingMove = isCastlingMove
+        if isCastlingMove:
+            code |= CASTLING_FLAG
+        self.code = code | CAPTURED_BITS[pieceCaptured]
+
+    # Wrap a packed move without looking at a board
+    @classmethod
+    def fromCode(cls, code):
+        move = cls.__new__(cls)
+        move.code = code
+        return move
 
-        self.moveID = self.startRow * 1000 + self.startCol * 100 + self.endRow * 10 + self.endCol
+    @property
+    def startRow(self):
+        return (self.code & 63) >> 3
 
+    @property
+    def startCol(self):
+        return self.code & 7
 
+    @property
+    def endRow(self):
+        return (self.code >> TO_SHIFT & 63) >> 3
+
+    @property
+    def endCol(self):
+        return self.code >> TO_SHIFT & 7
+
+    @property
+    def pieceMoved(self):
+        return PIECE_CODES[self.code >> MOVED_SHIFT & 15]
+
+    @property
+    def pieceCaptured(self):
+        return PIECE_CODES[self.code >> CAPTURED_SHIFT & 15]
+
+    @property
+    def isPawnPromotion(self):
+        return bool(self.code & PROMOTION_MASK)
+
+    @property
+    def promotionPiece(self):
+        promotion = self.code >> PROMOTION_SHIFT & 7
+        return self.promotionPieces[promotion - 1] if promotion else ""
+
+    @property
+    def isEnpassantMove(self):
+        return bool(self.code & ENPASSANT_FLAG)
+
+    @property
+    def isCastlingMove(self):
+        return bool(self.code & CASTLING_FLAG)
+
+    @property
+    def moveID(self):
+        return self.code & MOVE_KEY_MASK
 
     def __eq__(self, other):
         if isinstance(other, Move):
             return self.moveID == other.moveID
         return False
 
+    def __hash__(self):
+        return self.moveID
+
+    def __repr__(self):
+        return "Move(" + self.getChessNotation() + ")"
+
     def getChessNotation(self):
-        return self.getRankFile(self.startRow, self.startCol) + self.getRankFile(self.endRow, self.endCol)
+        return self.getRankFile(self.startRow, self.startCol) + self.getRankFile(self.endRow, self.endCol) + self.promotionPiece.lower()
 
     def getRankFile(self, r, c):
-        return self.colsToFiles[c] + self.rowsToRanks[r]
\ No newline at end of file
+        return self.colsToFiles[c] + self.rowsToRanks[r]
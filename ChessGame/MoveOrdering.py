@@ -0,0 +1,81 @@
+"""
+Move Ordering File:
+Responsibilities:
+1. Sorting moves so alpha beta looks at the most promising ones first
+2. Order: hash / PV move, captures by MVV-LVA, killer moves, then quiet moves by history score
+3. Remembering which quiet moves caused cutoffs (killers per ply and the history table)
+"""
+
+from ChessGame.Move import PIECE_CODES, MOVED_SHIFT, CAPTURED_SHIFT, PROMOTION_SHIFT, CAPTURED_MASK, PROMOTION_MASK, MOVE_KEY_MASK, Move
+
+HASH_MOVE_SCORE = 1000000
+CAPTURE_SCORE = 100000
+KILLER_SCORES = (90000, 80000) # First and second killer at a ply
+HISTORY_MAX = 50000 # Keep quiet moves below the killers
+
+
+# A capture, en passant or promotion, the moves that change material. Moves are packed codes
+def isTactical(move):
+    return bool(move & (CAPTURED_MASK | PROMOTION_MASK))
+
+
+# Default ordering used by the search, any object with the same methods can be plugged in
+# pieceValues is ChessAI.piecesScore or anything keyed the same way
+class MoveOrderer():
+    def __init__(self, pieceValues, maxPly = 128):
+        # Most valuable victim first, least valuable attacker breaks ties
+        # Indexed straight by the piece fields of the move code, index 0 is the empty square
+        self.victimValues = [10 * pieceValues[piece[1]] if piece != '--' else 0 for piece in PIECE_CODES]
+        self.attackerValues = [pieceValues[piece[1]] if piece != '--' else 0 for piece in PIECE_CODES]
+        self.promotionValues = [0] + [10 * pieceValues[piece] for piece in Move.promotionPieces]
+        self.killers = [[None, None] for _ in range(maxPly + 1)] # Packed quiet moves
+        self.history = [0] * (2 * 64 * 64) # [colour][from][to]
+
+    # Called once per search, old history is halved so it still helps but new cutoffs count more
+    def newSearch(self):
+        for ply in self.killers:
+            ply[0] = ply[1] = None
+        self.history = [score // 2 for score in self.history]
+
+    def scoreMove(self, move, ply, hashMove = None):
+        key = move & MOVE_KEY_MASK
+        if hashMove is not None and key == hashMove & MOVE_KEY_MASK:
+            return HASH_MOVE_SCORE
+        if move & PROMOTION_MASK:
+            return CAPTURE_SCORE + self.victimValues[move >> CAPTURED_SHIFT & 15] + self.promotionValues[move >> PROMOTION_SHIFT & 7]
+        if move & CAPTURED_MASK:
+            return CAPTURE_SCORE + self.victimValues[move >> CAPTURED_SHIFT & 15] - self.attackerValues[move >> MOVED_SHIFT & 15]
+        killers = self.killers[ply]
+        if move == killers[0]:
+            return KILLER_SCORES[0]
+        if move == killers[1]:
+            return KILLER_SCORES[1]
+        return self.history[self.historyIndex(move)]
+
+    # Sort moves best first, in place, and return them
+    def orderMoves(self, moves, ply, hashMove = None):
+        moves.sort(key = lambda move: self.scoreMove(move, ply, hashMove), reverse = True)
+        return moves
+
+    # Killers at a ply, tried by the staged move picker right after the captures
+    def killerMoves(self, ply):
+        return self.killers[ply]
+
+    # A quiet move refuted the opponent's move: remember it as a killer and bump its history
+    def recordCutoff(self, move, ply, depth):
+        if isTactical(move):
+            return
+        killers = self.killers[ply]
+        if killers[0] != move:
+            killers[1] = killers[0]
+            killers[0] = move
+
+        index = self.historyIndex(move)
+        self.history[index] += depth * depth
+        if self.history[index] >= HISTORY_MAX:
+            self.history = [score // 2 for score in self.history]
+
+    # Black pieces are codes 7 - 12, they use the second half of the table
+    def historyIndex(self, move):
+        colour = 4096 if (move >> MOVED_SHIFT & 15) > 6 else 0
+        return colour + (move & 4095)
@@ -0,0 +1,222 @@
+"""
+PGN File:
+Responsibilities:
+1. Standard algebraic notation (SAN) for moves of a GameState
+2. Writing finished games as PGN text, one game at a time so files can be streamed
+3. Reading PGN files of any size game by game, parsing SAN back into moves and replaying the games
+
+Usage:
+    python -m ChessGame.PGN games.pgn
+"""
+
+import re
+import sys
+import time
+
+from ChessGame.Move import Move
+from ChessGame.ChessEngine import GameState
+
+# Seven tag roster, always written first and in this order
+ROSTER = ["Event", "Site", "Date", "Round", "White", "Black", "Result"]
+RESULTS = ("1-0", "0-1", "1/2-1/2", "*")
+
+HEADER_PATTERN = re.compile(r'^\[\s*(\w+)\s+"(.*)"\s*\]$')
+SAN_PATTERN = re.compile(r"^([NBRQK])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([NBRQ]))?$")
+# Movetext tokens, in this order: comments, NAGs, move numbers, results, variation brackets, moves
+TOKEN_PATTERN = re.compile(r"\{[^}]*\}|;[^\n]*|\$\d+|\d+\.+|1-0|0-1|1/2-1/2|\*|[()]|[^\s{};$()]+")
+
+
+# SAN of a legal move in the current position, e.g. "Nbd7", "exd5", "e8=Q+", "O-O", "Qh7#"
+# legalMoves can be passed in when the caller already has them
+def toSan(gamestate, move, legalMoves = None):
+    if move.isCastlingMove:
+        san = "O-O" if move.endCol > move.startCol else "O-O-O"
+    else:
+        piece = move.pieceMoved[1]
+        target = move.getRankFile(move.endRow, move.endCol)
+        capture = move.pieceCaptured != '--'
+        if piece == "P":
+            san = (Move.colsToFiles[move.startCol] + "x" if capture else "") + target
+            if move.isPawnPromotion:
+                san += "=" + move.promotionPiece
+        else:
+            # Other pieces of the same kind that can reach the square decide how much of the start is needed
+            if legalMoves is None:
+                legalMoves = gamestate.getValidateMoves()
+            rivals = [other for other in legalMoves if other.pieceMoved == move.pieceMoved and other != move
+                      and (other.endRow, other.endCol) == (move.endRow, move.endCol)]
+            disambiguation = ""
+            if rivals:
+                if all(other.startCol != move.startCol for other in rivals):
+                    disambiguation = Move.colsToFiles[move.startCol]
+                elif all(other.startRow != move.startRow for other in rivals):
+                    disambiguation = Move.rowsToRanks[move.startRow]
+                else:
+                    disambiguation = move.getRankFile(move.startRow, move.startCol)
+            san = piece + disambiguation + ("x" if capture else "") + target
+
+    # Check or mate suffix, found by playing the move
+    gamestate.makeMoves(move)
+    if gamestate.inCheck():
+        san += "#" if not gamestate.generateMoves() else "+"
+    gamestate.undoMove()
+    return san
+
+
+# PGN text of one game: headers is a dict of tags, sanMoves the moves in SAN from the game's start
+# firstMoveNumber / whiteFirst place the moves when the game starts from a FEN
+def formatGame(headers, sanMoves, result = "*", firstMoveNumber = 1, whiteFirst = True):
+    headers = dict(headers, Result = result)
+    lines = ['[%s "%s"]' % (tag, str(headers.get(tag, "?")).replace('"', "'")) for tag in ROSTER]
+    lines += ['[%s "%s"]' % (tag, str(value).replace('"', "'")) for tag, value in headers.items() if tag not in ROSTER]
+
+    tokens = []
+    number, white = firstMoveNumber, whiteFirst
+    for i, san in enumerate(sanMoves):
+        if white:
+            tokens.append("%d. %s" % (number, san))
+        else:
+            tokens.append("%d... %s" % (number, san) if i == 0 else san)
+            number += 1
+        white = not white
+    tokens.append(result)
+
+    # Movetext is wrapped below 80 columns
+    movetext, line = [], ""
+    for token in tokens:
+        if line and len(line) + 1 + len(token) > 79:
+            movetext.append(line)
+            line = token
+        else:
+            line = line + " " + token if line else token
+    movetext.append(line)
+    return "\n".join(lines) + "\n\n" + "\n".join(movetext) + "\n\n"
+
+
+# The legal move a SAN string stands for, raises ValueError when it matches no move or several
+# Accepts the usual variations: check / annotation suffixes, 0-0 castling and promotions without "="
+def parseSan(gamestate, san, legalMoves = None):
+    if legalMoves is None:
+        legalMoves = gamestate.getValidateMoves()
+    text = san.rstrip("+#!?")
+    if text in ("O-O", "0-0", "O-O-O", "0-0-0"):
+        queenside = len(text) == 5
+        candidates = [move for move in legalMoves if move.isCastlingMove and (move.endCol < move.startCol) == queenside]
+    else:
+        match = SAN_PATTERN.match(text)
+        if match is None:
+            raise ValueError("Not a SAN move: " + san)
+        piece, file, rank, target, promotion = match.groups()
+        piece = piece or "P"
+        endRow, endCol = Move.ranks[target[1]], Move.filesToCols[target[0]]
+        candidates = [move for move in legalMoves if move.endRow == endRow and move.endCol == endCol
+                      and move.pieceMoved[1] == piece and move.promotionPiece == (promotion or "")
+                      and (file is None or move.startCol == Move.filesToCols[file])
+                      and (rank is None or move.startRow == Move.ranks[rank])]
+    if len(candidates) != 1:
+        raise ValueError(("Ambiguous" if candidates else "Illegal") + " move " + san + " in " + gamestate.toFen())
+    return candidates[0]
+
+
+# Lines of a path, or of anything that iterates over lines (an open file, a list of strings)
+def iterateLines(source):
+    if isinstance(source, str):
+        with open(source, encoding = "utf-8", errors = "replace") as file:
+            yield from file
+    else:
+        yield from source
+
+
+# (headers, movetext) for every game of source, one game in memory at a time
+def readGames(source):
+    headers, movetext = {}, []
+    openComment = False # A header like line inside a {...} comment is still movetext
+    for line in iterateLines(source):
+        line = line.strip()
+        if not openComment:
+            if not line or line.startswith("%"):
+                continue
+            match = HEADER_PATTERN.match(line)
+            if match:
+                if movetext:
+                    yield headers, "\n".join(movetext)
+                    headers, movetext = {}, []
+                headers[match.group(1)] = match.group(2).replace('\\"', '"')
+                continue
+        movetext.append(line)
+        openComment = line.rfind("{") > line.rfind("}") if "{" in line or "}" in line else openComment
+    if headers or movetext:
+        yield headers, "\n".join(movetext)
+
+
+# Main line SAN moves of a movetext and the result token closing it (None if missing)
+# Comments, NAGs, move numbers and variations are skipped
+def movetextMoves(movetext):
+    moves, depth, result = [], 0, None
+    for token in TOKEN_PATTERN.findall(movetext):
+        if token == "(":
+            depth += 1
+        elif token == ")":
+            depth = max(depth - 1, 0)
+        elif depth or token[0] in "{;$" or token[0].isdigit() and token.endswith("."):
+            continue
+        elif token in RESULTS:
+            result = token
+        else:
+            moves.append(token)
+    return moves, result
+
+
+# Replay every game of source, yielding (fen, move, result) before each move is played
+# fen is a snapshot of the position, so it stays valid however long the caller keeps it
+# A move that does not parse abandons the rest of its game, onError(headers, san, error) hears about it
+# onGame(headers) is called as each game starts, also for games without moves or cut short on their first one
+def replayGames(source, onError = None, onGame = None):
+    for headers, movetext in readGames(source):
+        if onGame is not None:
+            onGame(headers)
+        moves, result = movetextMoves(movetext)
+        result = headers.get("Result", result or "*")
+        try:
+            gamestate = GameState.fromFen(headers["FEN"]) if "FEN" in headers else GameState()
+        except (ValueError, IndexError, KeyError) as error:
+            if onError is not None:
+                onError(headers, headers["FEN"], error)
+            continue
+        for san in moves:
+            try:
+                move = parseSan(gamestate, san)
+            except ValueError as error:
+                if onError is not None:
+                    onError(headers, san, error)
+                break
+            yield gamestate.toFen(), move, result
+            gamestate.makeMoves(move)
+
+
+# Replays a file and reports how fast it goes, a quick check that a collection parses
+def main(argv = None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) != 1:
+        print("Usage: python -m ChessGame.PGN games.pgn")
+        return 2
+    errors = []
+    games, positions = 0, 0
+
+    def countGame(headers):
+        nonlocal games
+        games += 1
+
+    start = time.perf_counter()
+    for fen, move, result in replayGames(argv[0], lambda headers, san, error: errors.append(str(error)), countGame):
+        positions += 1
+    elapsed = time.perf_counter() - start
+    print("%d games, %d positions in %.1f s (%d positions/s), %d games cut short" % (
+        games, positions, elapsed, positions / max(elapsed, 1e-9), len(errors)))
+    for error in errors[:10]:
+        print("  " + error)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
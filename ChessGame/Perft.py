@@ -0,0 +1,165 @@
+"""
+Perft File:
+Responsibilities:
+1. Counting the leaf nodes of the legal move tree (perft) and splitting the count per root move (divide)
+2. A suite of standard positions with known correct counts to prove move generation right,
+   and of broken FENs that have to be turned away before they can corrupt the board
+3. Timing every depth (wall time and nodes per second) as JSON, from the command line or as a library
+
+Usage:
+    python -m ChessGame.Perft                      # whole suite up to depth 3
+    python -m ChessGame.Perft --depth 4 --position kiwipete
+    python -m ChessGame.Perft --fen "<fen>" --depth 2 --divide
+"""
+
+import argparse
+import json
+import sys
+import time
+
+from ChessGame.ChessEngine import GameState
+from ChessGame.Move import Move
+
+# Standard perft positions (chessprogramming.org/Perft_Results), expected node counts per depth
+POSITIONS = [
+    {
+        "name": "start",
+        "fen": "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+        "expected": {1: 20, 2: 400, 3: 8902, 4: 197281, 5: 4865609},
+    },
+    {
+        "name": "kiwipete", # Castling both ways, pins, en passant
+        "fen": "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+        "expected": {1: 48, 2: 2039, 3: 97862, 4: 4085603},
+    },
+    {
+        "name": "enpassant", # En passant discovered checks along the rank
+        "fen": "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+        "expected": {1: 14, 2: 191, 3: 2812, 4: 43238, 5: 674624},
+    },
+    {
+        "name": "promotion", # Promotions and under promotions with captures, castling out of reach
+        "fen": "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+        "expected": {1: 6, 2: 264, 3: 9467, 4: 422333},
+    },
+    {
+        "name": "castling", # Castling through and out of check, promotion on d8
+        "fen": "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+        "expected": {1: 44, 2: 1486, 3: 62379, 4: 2103487},
+    },
+    {
+        "name": "middlegame",
+        "fen": "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+        "expected": {1: 46, 2: 2079, 3: 89890, 4: 3894594},
+    },
+]
+
+# FENs GameState must reject with a ValueError, each once loaded and generated moves on a board it could not handle
+INVALID_FENS = [
+    {"name": "enpassant-own-pawn", "fen": "4k3/8/8/8/8/8/3PP3/4K3 w - e3 0 1"}, # Wrong rank for the side to move
+    {"name": "enpassant-no-pawn", "fen": "4k3/8/8/3P4/8/8/8/4K3 w - e6 0 1"}, # No black pawn on e5
+    {"name": "enpassant-occupied", "fen": "4k3/8/4p3/4p3/8/8/8/4K3 w - e6 0 1"}, # Target square taken
+    {"name": "enpassant-blocked", "fen": "4k3/4n3/8/4p3/8/8/8/4K3 w - e6 0 1"}, # The pawn could not have passed e7
+    {"name": "pawn-last-rank", "fen": "4k2P/8/8/8/8/8/8/4K3 w - - 0 1"},
+    {"name": "pawn-first-rank", "fen": "4k3/8/8/8/8/8/8/p3K3 b - - 0 1"},
+    {"name": "bad-counters", "fen": "4k3/8/8/8/8/8/8/4K3 w - - x 1"},
+]
+
+
+# Number of leaf nodes depth plies below the current position
+def perft(gamestate, depth):
+    moves = gamestate.generateMoves()
+    if depth <= 1:
+        return len(moves) if depth == 1 else 1 # Bulk count the last ply
+    nodes = 0
+    for move in moves:
+        gamestate.makeMoves(move)
+        nodes += perft(gamestate, depth - 1)
+        gamestate.undoMove()
+    return nodes
+
+
+# Perft split by root move, {notation: nodes}, the way to find which move a count goes wrong under
+def divide(gamestate, depth):
+    counts = {}
+    for move in gamestate.generateMoves():
+        gamestate.makeMoves(move)
+        counts[Move.fromCode(move).getChessNotation()] = perft(gamestate, depth - 1)
+        gamestate.undoMove()
+    return counts
+
+
+# Time perft on one position at every depth up to maxDepth, one result dict per depth
+def runPosition(fen, maxDepth, expected = None, name = None):
+    results = []
+    gamestate = GameState.fromFen(fen)
+    for depth in range(1, maxDepth + 1):
+        start = time.perf_counter()
+        nodes = perft(gamestate, depth)
+        seconds = time.perf_counter() - start
+        known = expected.get(depth) if expected else None
+        results.append({
+            "name": name or fen,
+            "depth": depth,
+            "nodes": nodes,
+            "expected": known,
+            "passed": None if known is None else nodes == known,
+            "seconds": round(seconds, 6),
+            "nps": int(nodes / seconds) if seconds > 0 else None,
+        })
+    return results
+
+
+# Run the standard suite, depths without a known count are skipped
+def runSuite(maxDepth = 3, names = None):
+    results = []
+    for position in POSITIONS:
+        if names and position["name"] not in names:
+            continue
+        depth = min(maxDepth, max(position["expected"]))
+        results.extend(runPosition(position["fen"], depth, position["expected"], position["name"]))
+    return results
+
+
+# Load every INVALID_FENS entry, passed when GameState raises ValueError on it
+def runInvalidFens():
+    results = []
+    for position in INVALID_FENS:
+        try:
+            GameState.fromFen(position["fen"])
+            rejected = False
+        except ValueError:
+            rejected = True
+        results.append({"name": position["name"], "fen": position["fen"], "rejected": rejected, "passed": rejected})
+    return results
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Perft move generation check and benchmark")
+    parser.add_argument("--depth", type = int, default = 3)
+    parser.add_argument("--position", action = "append", help = "name of a suite position, repeatable")
+    parser.add_argument("--fen", help = "count an arbitrary position instead of the suite")
+    parser.add_argument("--divide", action = "store_true", help = "split the count by root move")
+    args = parser.parse_args(argv)
+
+    if args.divide:
+        fen = args.fen or next(p["fen"] for p in POSITIONS if p["name"] == (args.position or ["start"])[0])
+        counts = divide(GameState.fromFen(fen), args.depth)
+        print(json.dumps({"fen": fen, "depth": args.depth, "moves": counts, "nodes": sum(counts.values())}))
+        return 0
+
+    if args.fen:
+        results = runPosition(args.fen, args.depth)
+    else:
+        results = runSuite(args.depth, args.position)
+        if not args.position:
+            results.extend(runInvalidFens())
+
+    # One JSON object per line so results can be streamed into other tools
+    for result in results:
+        print(json.dumps(result))
+    return 1 if any(result["passed"] is False for result in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
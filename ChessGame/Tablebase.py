@@ -0,0 +1,263 @@
+"""
+Tablebase File:
+Responsibilities:
+1. Retrograde analysis of small pawnless endings (up to 4 pieces, e.g. KQvK, KRvK, KQvKR)
+2. Writing one byte per position, the distance to mate in plies, to a flat file per material set
+3. Probing those files through np.memmap so search gets exact results without loading anything
+
+A table for a material set of n pieces is a uint8 array of shape (2, 64, ..., 64): side to move
+(0 white, 1 black) and then the square (row * 8 + col) of every piece, in the order of the name
+(white pieces then black pieces, each side ordered K Q R B N). A value is the number of plies to
+mate with best play: even when the side to move is getting mated, odd when it mates. DRAW and
+BROKEN (pieces on top of each other or the side not to move in check) mark the rest.
+
+Usage:
+    python -m ChessGame.Tablebase KQvK KRvK KQvKR --dir tables
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+from ChessGame.Bitboard import KNIGHT_ATTACKS, KING_ATTACKS, BETWEEN, squares, popCount, rookAttacks, bishopAttacks, queenAttacks
+
+DRAW = 255
+BROKEN = 254
+MAX_PIECES = 4
+PIECE_ORDER = "KQRBN"
+
+# Empty board targets per piece type, blocking is checked separately with BETWEEN
+TARGETS = {
+    "K": KING_ATTACKS,
+    "Q": [queenAttacks(sq, 0) for sq in range(64)],
+    "R": [rookAttacks(sq, 0) for sq in range(64)],
+    "B": [bishopAttacks(sq, 0) for sq in range(64)],
+    "N": KNIGHT_ATTACKS,
+}
+
+
+# Pieces of a material name in table order, "KQvKR" -> ["wK", "wQ", "bK", "bR"]
+def parseMaterial(name):
+    white, black = name.upper().split("V")
+    if not white.startswith("K") or not black.startswith("K") or "K" in white[1:] + black[1:]:
+        raise ValueError("Material needs exactly one king per side: " + name)
+    if any(piece not in PIECE_ORDER for piece in white + black):
+        raise ValueError("Only pawnless material is supported: " + name)
+    return ["w" + piece for piece in sorted(white, key = PIECE_ORDER.index)] + \
+           ["b" + piece for piece in sorted(black, key = PIECE_ORDER.index)]
+
+
+def materialName(pieces):
+    return "".join(piece[1] for piece in pieces if piece[0] == "w") + "v" + "".join(piece[1] for piece in pieces if piece[0] == "b")
+
+
+# 64 booleans, True on the squares not set in bb
+def freeSquares(bb):
+    return np.array([not (bb >> sq) & 1 for sq in range(64)], dtype = bool)
+
+
+# Retrograde generator for one material set, smaller sets reached by a capture are passed in finished
+class Generator():
+    def __init__(self, pieces, subtables):
+        self.pieces = pieces
+        self.n = len(pieces)
+        self.shape = (64,) * self.n
+        self.subtables = subtables # {captured piece index: dtm array of the set without it}
+        # (from, to, squares that must be free) for every piece type, blocking squares include the target
+        self.moves = {piece: [(f, t, freeSquares(BETWEEN[f][t] | 1 << t)) for f in range(64) for t in squares(TARGETS[piece][f])]
+                      for piece in PIECE_ORDER}
+
+    # Index tuple fixing piece i on square sq (and piece j on square sq2)
+    def at(self, i, sq, j = None, sq2 = None):
+        index = [slice(None)] * self.n
+        index[i] = sq
+        if j is not None:
+            index[j] = sq2
+        return tuple(index)
+
+    # AND a per piece mask of allowed squares along every axis of array (axes holds the piece of each axis)
+    def restrict(self, array, axes, mask):
+        dims = len(axes)
+        for k in range(dims):
+            shape = [1] * dims
+            shape[k] = 64
+            array &= mask.reshape(shape)
+        return array
+
+    # For side to move, True where some move of theirs reaches a position in target (other side to move)
+    # captureTargets[j]: the same for positions after piece j is captured, in the smaller set's layout
+    def reaches(self, side, target, captureTargets):
+        colour = "wb"[side]
+        result = np.zeros(self.shape, dtype = bool)
+        for i, piece in enumerate(self.pieces):
+            if piece[0] != colour:
+                continue
+            others = [k for k in range(self.n) if k != i]
+            for f, t, free in self.moves[piece[1]]:
+                # Quiet move: no piece on the way or on the target square
+                reached = self.restrict(target[self.at(i, t)].copy(), others, free)
+                result[self.at(i, f)] |= reached
+
+                # Capture: enemy piece j on the target square, nothing else on the way
+                for j, captured in enumerate(self.pieces):
+                    if captured[0] == colour or captured[1] == "K":
+                        continue
+                    sub = captureTargets[j]
+                    subIndex = [slice(None)] * (self.n - 1)
+                    subIndex[i if i < j else i - 1] = t
+                    rest = [k for k in others if k != j]
+                    reached = self.restrict(sub[tuple(subIndex)].copy(), rest, free)
+                    result[self.at(i, f, j, t)] |= reached
+        return result
+
+    # True where the king of side is attacked
+    def inCheck(self, side):
+        king = self.pieces.index("wK" if side == 0 else "bK")
+        enemy = "b" if side == 0 else "w"
+        result = np.zeros(self.shape, dtype = bool)
+        for i, piece in enumerate(self.pieces):
+            if piece[0] != enemy:
+                continue
+            rest = [k for k in range(self.n) if k not in (i, king)]
+            for f, t, free in self.moves[piece[1]]:
+                free = free.copy()
+                free[t] = True # The king itself stands there
+                result[self.at(i, f, king, t)] |= self.restrict(np.ones((64,) * len(rest), dtype = bool), rest, free)
+        return result
+
+    def broken(self, side):
+        overlap = np.zeros(self.shape, dtype = bool)
+        squareIndex = np.arange(64)
+        for i in range(self.n):
+            for j in range(i + 1, self.n):
+                shape = [1] * self.n
+                shape[i] = 64
+                a = squareIndex.reshape(shape)
+                shape = [1] * self.n
+                shape[j] = 64
+                overlap |= a == squareIndex.reshape(shape)
+        return overlap | self.inCheck(1 - side)
+
+    # Run the analysis, returns the (2, 64, ...) uint8 distance to mate array
+    def run(self):
+        dtm = np.full((2,) + self.shape, DRAW, dtype = np.uint8)
+        legal = []
+        for side in (0, 1):
+            broken = self.broken(side)
+            dtm[side][broken] = BROKEN
+            legal.append(~broken)
+
+        def subTargets(side, select):
+            return {j: select(sub[1 - side]) for j, sub in self.subtables.items()}
+
+        # Mated in 0: in check without a legal move. Positions without a move stay drawn (stalemate)
+        hasMoves = []
+        for side in (0, 1):
+            hasMoves.append(self.reaches(side, legal[1 - side], subTargets(side, lambda sub: sub != BROKEN)))
+            dtm[side][legal[side] & ~hasMoves[side] & self.inCheck(side)] = 0
+
+        # Ply n: wins (odd n) move into a loss in n - 1, losses (even n) have every move going into a win
+        longestSub = max([int(sub[sub < BROKEN].max(initial = 0)) for sub in self.subtables.values()] + [0])
+        n, quiet = 1, 0
+        while quiet < 2 or n <= longestSub + 1:
+            found = []
+            for side in (0, 1):
+                unresolved = dtm[side] == DRAW
+                other = dtm[1 - side]
+                if n % 2:
+                    new = unresolved & self.reaches(side, other == n - 1, subTargets(side, lambda sub: sub == n - 1))
+                else:
+                    # An escape is any legal move to a position the opponent has not already won by now
+                    escapes = self.reaches(side, (other != BROKEN) & ~((other % 2 == 1) & (other < n)),
+                                           subTargets(side, lambda sub: (sub != BROKEN) & ~((sub % 2 == 1) & (sub < n))))
+                    new = unresolved & hasMoves[side] & ~escapes
+                found.append(new)
+            for side in (0, 1):
+                dtm[side][found[side]] = n
+            quiet = 0 if any(new.any() for new in found) else quiet + 1
+            n += 1
+        return dtm
+
+
+# Build the table for name and every smaller set a capture leads to, writing name.dtm files into directory
+def generate(name, directory = "tables", verbose = False):
+    pieces = parseMaterial(name)
+    name = materialName(pieces)
+    path = os.path.join(directory, name + ".dtm")
+    if os.path.exists(path):
+        return np.memmap(path, dtype = np.uint8, mode = "r", shape = (2,) + (64,) * len(pieces))
+
+    subtables = {}
+    for j, piece in enumerate(pieces):
+        if piece[1] != "K":
+            subtables[j] = generate(materialName(pieces[:j] + pieces[j + 1:]), directory, verbose)
+
+    start = time.perf_counter()
+    dtm = Generator(pieces, subtables).run()
+    os.makedirs(directory, exist_ok = True)
+    dtm.tofile(path)
+    if verbose:
+        print(name, "generated in", round(time.perf_counter() - start, 1), "s, longest mate",
+              int(dtm[dtm < BROKEN].max(initial = 0)), "plies")
+    return np.memmap(path, dtype = np.uint8, mode = "r", shape = dtm.shape)
+
+
+# Looks positions up in the generated files, they are memory mapped the first time a set is probed
+class Tablebase():
+    def __init__(self, directory = "tables"):
+        self.directory = directory
+        self.tables = {}
+
+    def table(self, name, n):
+        if name not in self.tables:
+            path = os.path.join(self.directory, name + ".dtm")
+            self.tables[name] = np.memmap(path, dtype = np.uint8, mode = "r", shape = (2,) + (64,) * n) if os.path.exists(path) else None
+        return self.tables[name]
+
+    # Plies to mate for the side to move: positive when it mates, negative when it gets mated, 0 for a draw
+    # None when the position is not covered (pawns, castling, en passant, too many pieces, no file)
+    # or is already checkmate, which the move generator reports anyway
+    def probe(self, gamestate):
+        if popCount(gamestate.occupied) > MAX_PIECES or gamestate.enpassantPossbile or gamestate.castlingRights:
+            return None
+
+        pieces = []
+        for sq in squares(gamestate.occupied):
+            piece = gamestate.mailbox[sq >> 3][sq & 7]
+            if piece[1] == "P":
+                return None
+            pieces.append((piece, sq))
+        side = 0 if gamestate.whiteToMove else 1
+
+        # Try the position as it is, then with the colours swapped and the board flipped
+        for flip in (False, True):
+            if flip:
+                pieces = [(("b" if piece[0] == "w" else "w") + piece[1], sq ^ 56) for piece, sq in pieces]
+                side = 1 - side
+            ordered = sorted(pieces, key = lambda entry: (entry[0][0] != "w", PIECE_ORDER.index(entry[0][1])))
+            table = self.table(materialName([piece for piece, sq in ordered]), len(ordered))
+            if table is not None:
+                value = int(table[(side,) + tuple(sq for piece, sq in ordered)])
+                if value == DRAW:
+                    return 0
+                if value >= BROKEN or value == 0:
+                    return None
+                return value if value % 2 else -value
+        return None
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Generate pawnless endgame tablebases by retrograde analysis")
+    parser.add_argument("material", nargs = "+", help = "material sets such as KQvK KRvK KQvKR")
+    parser.add_argument("--dir", default = "tables", help = "directory the .dtm files go to")
+    args = parser.parse_args(argv)
+    for name in args.material:
+        generate(name, args.dir, verbose = True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,151 @@
+"""
+Transposition Table File:
+Responsibilities:
+1. Remembering searched positions (best move, score, depth, bound) by their Zobrist key
+2. Keeping the table in one preallocated NumPy array sized in megabytes, so memory never grows during a search
+3. Letting several search processes read and write the same table in multiprocessing.shared_memory without locks (Lazy SMP)
+"""
+
+import numpy as np
+from multiprocessing import shared_memory
+
+# Bound of a stored score: exact, at least (failed high) or at most (failed low)
+EXACT = 0
+LOWER = 1
+UPPER = 2
+
+DEFAULT_ENTRIES = 1 << 18 # 4 MB
+
+# Every entry is two 64 bit words: data packs the entry, check is the Zobrist key XOR data
+# Processes write without locks, a half written entry no longer XORs back to its key and is ignored
+ENTRY = np.dtype([("check", np.uint64), ("data", np.uint64)])
+
+# Packing of data, probe hands it back as it is:
+#   bits  0 - 24  best move code (0 when there is none)
+#   bits 25 - 44  score + SCORE_OFFSET
+#   bits 45 - 52  depth
+#   bits 53 - 54  bound
+#   bits 55 - 62  age, the search that stored the entry
+MOVE_MASK = (1 << 25) - 1
+SCORE_SHIFT = 25
+SCORE_MASK = (1 << 20) - 1
+SCORE_OFFSET = 1 << 19
+DEPTH_SHIFT = 45
+BOUND_SHIFT = 53
+AGE_SHIFT = 55
+AGE_MASK = 0xFF
+
+# Entries are grouped in buckets of two: the first keeps the deepest result of the current search,
+# the second always takes whatever the first turned away
+BUCKET_SIZE = 2
+
+
+# Largest power of two number of entries that fits in megabytes
+def entriesFor(megabytes):
+    entries = max(int(megabytes * (1 << 20)) // ENTRY.itemsize, BUCKET_SIZE)
+    return 1 << (entries.bit_length() - 1)
+
+
+class TranspositionTable():
+    # entries is rounded down to a power of two (at least one bucket) so the bucket is just the low bits of the key
+    # buffer: memory to lay the table over (a SharedMemory buffer), a private array is used without one
+    def __init__(self, entries = DEFAULT_ENTRIES, buffer = None):
+        entries = 1 << (max(entries, BUCKET_SIZE).bit_length() - 1)
+        self.entries = entries
+        self.mask = entries // BUCKET_SIZE - 1
+        self.age = 0
+        self.sharedMemory = None
+        if buffer is None:
+            self.table = np.zeros(entries, dtype = ENTRY)
+        else:
+            self.table = np.ndarray(entries, dtype = ENTRY, buffer = buffer)
+        # The same memory as flat 64 bit words (check, data, check, data, ...): indexing it reads and
+        # writes plain ints, without the NumPy scalars that indexing the array would create
+        self.words = memoryview(self.table.view(np.uint64)).cast("B").cast("Q")
+
+    # Table taking at most megabytes of memory
+    @classmethod
+    def fromMegabytes(cls, megabytes):
+        return cls(entriesFor(megabytes))
+
+    # New table in shared memory, other processes open it with attach(table.name, table.entries)
+    @classmethod
+    def createShared(cls, entries = DEFAULT_ENTRIES):
+        entries = 1 << (max(entries, BUCKET_SIZE).bit_length() - 1)
+        memory = shared_memory.SharedMemory(create = True, size = entries * ENTRY.itemsize)
+        table = cls(entries, memory.buf)
+        table.sharedMemory = memory
+        table.clear()
+        return table
+
+    # Open a table another process created with createShared
+    @classmethod
+    def attach(cls, name, entries):
+        memory = shared_memory.SharedMemory(name = name)
+        table = cls(entries, memory.buf)
+        table.sharedMemory = memory
+        return table
+
+    @property
+    def name(self):
+        return self.sharedMemory.name if self.sharedMemory is not None else None
+
+    @property
+    def megabytes(self):
+        return self.entries * ENTRY.itemsize / (1 << 20)
+
+    def clear(self):
+        self.table.fill(0)
+        self.age = 0
+
+    # Called at the start of every search: entries of earlier searches become the first to be replaced
+    def newSearch(self):
+        self.age = (self.age + 1) & AGE_MASK
+
+    # Stop using the table in this process, the creator also calls unlink to free the memory
+    def close(self):
+        if self.sharedMemory is not None:
+            # The views hold on to the buffer, they have to go before the memory can be closed
+            self.words.release()
+            self.table = self.words = None
+            self.sharedMemory.close()
+
+    def unlink(self):
+        if self.sharedMemory is not None:
+            self.sharedMemory.unlink()
+
+    # Packed data stored for key (see the layout above), 0 when the position is not in the table
+    # Callers take it apart with the shifts and masks of this file, nothing is built for a lookup
+    def probe(self, key):
+        words = self.words
+        slot = (key & self.mask) << 2 # Word index of the bucket, two words per entry
+        data = words[slot + 1]
+        if data and words[slot] ^ data == key:
+            return data
+        data = words[slot + 3]
+        if data and words[slot + 2] ^ data == key:
+            return data
+        return 0
+
+    # Depth preferred entry: replaced by the same position, by a result from an older search or by one
+    # at least as deep. Anything else goes to the always replace entry of the bucket
+    def store(self, key, move, score, depth, bound):
+        words = self.words
+        slot = (key & self.mask) << 2
+        age = self.age
+        old = words[slot + 1]
+        if words[slot] ^ old == key:
+            if old >> AGE_SHIFT == age and old >> DEPTH_SHIFT & 0xFF > depth:
+                return # A deeper result of this search is already there
+        elif old and old >> AGE_SHIFT == age and old >> DEPTH_SHIFT & 0xFF > depth:
+            slot += 2
+        data = (move or 0) | (score + SCORE_OFFSET) << SCORE_SHIFT | depth << DEPTH_SHIFT | bound << BOUND_SHIFT | age << AGE_SHIFT
+        words[slot + 1] = data
+        words[slot] = key ^ data
+
+    # Permille of the first thousand entries used by the current search (UCI hashfull)
+    def hashfull(self):
+        words = self.words
+        sample = min(self.entries, 1000)
+        used = sum(1 for i in range(1, 2 * sample, 2) if words[i] and words[i] >> AGE_SHIFT == self.age)
+        return used * 1000 // sample
@@ -0,0 +1,182 @@
+"""
+UCI File:
+Responsibilities:
+1. Speaking the Universal Chess Interface on stdin / stdout, for chess GUIs and tournament managers
+2. Setting up positions (position startpos / fen ... moves ...) and turning go limits into a search budget
+3. Running the search on a worker thread so stop, isready and quit are answered straight away
+
+Usage:
+    python -m ChessGame.UCI
+"""
+
+import sys
+import threading
+
+from ChessGame.ChessEngine import GameState
+from ChessGame.MoveOrdering import MoveOrderer
+from ChessGame.TranspositionTable import TranspositionTable
+from ChessGame import ChessAI
+
+ENGINE_NAME = "ChessGame"
+ENGINE_AUTHOR = "nhantran1711"
+DEFAULT_HASH_MB = 16
+MOVES_TO_GO = 30 # Moves the clock is assumed to be shared over when the GUI does not say
+
+
+# Score as UCI wants it: centipawns, or mate in moves (negative when getting mated)
+def formatScore(score):
+    if score >= ChessAI.CHECKMATE - ChessAI.MAX_PLY:
+        return "mate " + str((ChessAI.CHECKMATE - score + 1) // 2)
+    if score <= -(ChessAI.CHECKMATE - ChessAI.MAX_PLY):
+        return "mate -" + str((ChessAI.CHECKMATE + score) // 2)
+    return "cp " + str(score)
+
+
+# Seconds to spend on a move from the go arguments, None for no time limit
+def timeForMove(limits, whiteToMove):
+    if "movetime" in limits:
+        return limits["movetime"] / 1000
+    remaining = limits.get("wtime" if whiteToMove else "btime")
+    if remaining is None:
+        return None
+    increment = limits.get("winc" if whiteToMove else "binc", 0)
+    budget = remaining / limits.get("movestogo", MOVES_TO_GO) + increment / 2
+    return max(min(budget, remaining / 2), 1) / 1000 # Never plan to use more than half of what is left
+
+
+class UCIEngine():
+    def __init__(self, output = sys.stdout):
+        self.output = output
+        self.gamestate = GameState()
+        self.ordering = MoveOrderer(ChessAI.piecesScore, ChessAI.MAX_PLY)
+        self.table = TranspositionTable.fromMegabytes(DEFAULT_HASH_MB)
+        self.worker = None
+        self.stop = threading.Event()
+        self.lock = threading.Lock() # One writer at a time, info lines come from the worker
+
+    def send(self, line):
+        with self.lock:
+            self.output.write(line + "\n")
+            self.output.flush()
+
+    # Handle one line from the GUI, returns False once the engine should exit
+    def command(self, line):
+        tokens = line.split()
+        if not tokens:
+            return True
+        name, args = tokens[0], tokens[1:]
+        if name == "uci":
+            self.send("id name " + ENGINE_NAME)
+            self.send("id author " + ENGINE_AUTHOR)
+            self.send("option name Hash type spin default %d min 1 max 4096" % DEFAULT_HASH_MB)
+            self.send("option name BookFile type string default <empty>")
+            self.send("option name TablebasePath type string default <empty>")
+            self.send("uciok")
+        elif name == "isready":
+            self.send("readyok")
+        elif name == "setoption":
+            self.setOption(args)
+        elif name == "ucinewgame":
+            self.stopSearch()
+            self.ordering = MoveOrderer(ChessAI.piecesScore, ChessAI.MAX_PLY)
+            self.table.clear()
+        elif name == "position":
+            self.stopSearch()
+            self.setPosition(args)
+        elif name == "go":
+            self.stopSearch()
+            self.go(args)
+        elif name == "stop":
+            self.stopSearch()
+        elif name == "quit":
+            self.stopSearch()
+            return False
+        return True
+
+    # setoption name <name> value <value>
+    def setOption(self, args):
+        if "name" not in args:
+            return
+        valueAt = args.index("value") if "value" in args else len(args)
+        option = " ".join(args[args.index("name") + 1:valueAt]).lower()
+        value = " ".join(args[valueAt + 1:])
+        if value == "<empty>":
+            value = ""
+        if option == "hash" and value.isdigit():
+            self.table = TranspositionTable.fromMegabytes(max(int(value), 1))
+        elif option == "bookfile":
+            ChessAI.useOpeningBook(value or None)
+        elif option == "tablebasepath":
+            ChessAI.useTablebase(value or None)
+
+    # position startpos | fen <fen> [moves <move> ...]
+    # A FEN that does not parse is reported and the previous position is kept
+    def setPosition(self, args):
+        movesAt = args.index("moves") if "moves" in args else len(args)
+        if args and args[0] == "fen":
+            fen = " ".join(args[1:movesAt])
+            try:
+                gamestate = GameState.fromFen(fen)
+            except ValueError:
+                self.send("info string invalid fen " + fen)
+                return
+        else:
+            gamestate = GameState()
+        for notation in args[movesAt + 1:]:
+            move = next((move for move in gamestate.getValidateMoves() if move.getChessNotation() == notation), None)
+            if move is None:
+                self.send("info string illegal move " + notation)
+                break
+            gamestate.makeMoves(move)
+        self.gamestate = gamestate
+
+    # go [depth n] [nodes n] [movetime ms] [wtime ms btime ms winc ms binc ms movestogo n] [infinite]
+    def go(self, args):
+        limits = {}
+        for i, token in enumerate(args[:-1]):
+            if token in ("depth", "nodes", "movetime", "wtime", "btime", "winc", "binc", "movestogo") and args[i + 1].lstrip("-").isdigit():
+                limits[token] = int(args[i + 1])
+        infinite = "infinite" in args
+        self.stop = threading.Event()
+        self.worker = threading.Thread(target = self.search, args = (self.gamestate, limits, infinite, self.stop), daemon = True)
+        self.worker.start()
+
+    def search(self, gamestate, limits, infinite, stop):
+        validMoves = gamestate.getValidateMoves()
+        move = ChessAI.bookMove(gamestate) if not infinite else None
+        if move is None and validMoves:
+            timeLimit = None if infinite else timeForMove(limits, gamestate.whiteToMove)
+            maxDepth = limits.get("depth", ChessAI.MAX_DEPTH)
+            search = ChessAI.Search(gamestate, maxDepth, timeLimit, limits.get("nodes"), self.ordering, self.table, stop,
+                                    report = self.info)
+            move = search.run(validMoves).bestMove
+        if infinite:
+            stop.wait() # bestmove may only be sent after stop
+        self.send("bestmove " + (move.getChessNotation() if move is not None else "0000"))
+
+    # One info line per finished iteration
+    def info(self, result):
+        elapsed = max(result.elapsed, 1e-6)
+        self.send("info depth %d score %s nodes %d nps %d time %d hashfull %d tbhits %d pv %s" % (
+            result.depth, formatScore(result.score), result.nodes, int(result.nodes / elapsed), int(result.elapsed * 1000),
+            self.table.hashfull(), result.stats.tablebaseHits, " ".join(move.getChessNotation() for move in result.pv)))
+
+    # Ask the running search to stop and wait for its bestmove
+    def stopSearch(self):
+        if self.worker is not None:
+            self.stop.set()
+            self.worker.join()
+            self.worker = None
+
+
+def main(input = sys.stdin, output = sys.stdout):
+    engine = UCIEngine(output)
+    for line in input:
+        if not engine.command(line):
+            break
+    engine.stopSearch()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,33 @@
+"""
+Zobrist File:
+Responsibilities:
+1. Fixed 64 bit random keys for every (piece, square), side to move, castling rights and en passant file
+2. Helpers turning GameState pieces of state into the key they contribute
+"""
+
+import random
+
+from ChessGame.Bitboard import PAWN_ATTACKS
+
+# Seeded so keys are the same in every process (shared tables, saved positions)
+_rng = random.Random(0x5EED)
+
+
+def _key():
+    return _rng.getrandbits(64)
+
+
+PIECE_KEYS = {colour + piece: [_key() for _ in range(64)] for colour in "wb" for piece in "PNBRQK"}
+SIDE_KEY = _key() # XORed in when black is to move
+CASTLING_KEYS = [_key() for _ in range(16)] # Indexed by the 4 bit castling mask (see CastleRight)
+ENPASSANT_KEYS = [_key() for _ in range(8)] # Indexed by the en passant file
+
+
+# The file only counts when one of pawns (those of the side to move) attacks the square, otherwise the
+# position is the same as without it and has to hash the same for repetitions (as Polyglot does)
+def enpassantKey(enpassantPossible, whiteToMove, pawns):
+    if enpassantPossible:
+        row, col = enpassantPossible
+        if PAWN_ATTACKS['b' if whiteToMove else 'w'][row * 8 + col] & pawns:
+            return ENPASSANT_KEYS[col]
+    return 0